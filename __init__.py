@@ -1,52 +1,63 @@
-from .nodes import UmiAIWildcardNode
+from .nodes import UmiAIWildcardNode, WILDCARD_CATALOG, CATALOG_API_MAX_AGE, CATALOG_BROADCASTER, WARMUP
 from server import PromptServer
 from aiohttp import web
-import os
-import glob
-import yaml
-import folder_paths # New Import for LoRA scanning
+import gzip
+import json
+import asyncio
+import threading
 
 # 1. Setup the API Route
 def get_wildcard_data():
-    wildcards_path = os.path.join(os.path.dirname(__file__), "wildcards")
-    files = []
-    tags = set()
-    
-    if os.path.exists(wildcards_path):
-        # 1. Recursive search for files
-        for ext in ['*.txt', '*.yaml']:
-            for filepath in glob.glob(os.path.join(wildcards_path, '**', ext), recursive=True):
-                # Get relative path for __file__
-                rel_path = os.path.relpath(filepath, wildcards_path)
-                tag_name = os.path.splitext(rel_path)[0].replace(os.sep, '/')
-                files.append(tag_name)
-
-                # 2. If YAML, parse it for Tags
-                if ext == '*.yaml':
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = yaml.safe_load(f)
-                            if isinstance(data, dict):
-                                for entry in data.values():
-                                    if isinstance(entry, dict) and 'Tags' in entry:
-                                        # Add all tags to the set (deduplicated)
-                                        for t in entry['Tags']:
-                                            tags.add(str(t).strip())
-                    except Exception as e:
-                        print(f"[UmiAI] Error parsing YAML {filepath}: {e}")
-
-    # Return Files, Tags, AND LoRAs
-    return {
-        "files": sorted(files),
-        "tags": sorted(list(tags)),
-        "loras": folder_paths.get_filename_list("loras")
+    """(catalog version, payload). Same catalog the node resolves from: every wildcard root,
+    .txt/.yaml/.csv files and YAML entry keys."""
+    WILDCARD_CATALOG.refresh(max_age=CATALOG_API_MAX_AGE)
+    snap = WILDCARD_CATALOG.snapshot
+    return snap.etag(), {
+        "files": sorted(snap.files_index),
+        "tags": sorted(snap.umi_tags),
+        "loras": list(snap.loras),
     }
 
+# Serialized response for the current catalog version, rebuilt only when files change
+WILDCARD_RESPONSE = {}
+WILDCARD_RESPONSE_LOCK = threading.Lock()
+
+def get_wildcard_response():
+    global WILDCARD_RESPONSE
+    # One scan at a time; concurrent page loads wait and then reuse its result
+    with WILDCARD_RESPONSE_LOCK:
+        WILDCARD_CATALOG.refresh(max_age=CATALOG_API_MAX_AGE)
+        if WILDCARD_RESPONSE.get('etag') == f'"{WILDCARD_CATALOG.etag()}"':
+            return WILDCARD_RESPONSE
+        version, data = get_wildcard_data()
+        body = json.dumps(data).encode('utf-8')
+        WILDCARD_RESPONSE = {'etag': f'"{version}"', 'body': body, 'gzip': gzip.compress(body, compresslevel=6)}
+        return WILDCARD_RESPONSE
+
 # Register the route
 @PromptServer.instance.routes.get("/umi/wildcards")
 async def fetch_wildcards(request):
-    data = get_wildcard_data()
-    return web.json_response(data)
+    loop = asyncio.get_running_loop()
+    cached = await loop.run_in_executor(None, get_wildcard_response)
+    headers = {"ETag": cached['etag'], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("If-None-Match", "")
+    if cached['etag'] in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return web.Response(status=304, headers=headers)
+
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+        return web.Response(body=cached['gzip'], content_type="application/json", headers=headers)
+    return web.Response(body=cached['body'], content_type="application/json", headers=headers)
+
+# Build the catalog, autocomplete payload, LLM registry and LoRA header index off the
+# main thread so the first run and the first editor load don't have to
+if WILDCARD_CATALOG.shared is None:
+    WARMUP.add_step("editor payload", lambda: len(get_wildcard_response()['body']), before="gguf registry")
+WARMUP.start()
+
+# Watch wildcard roots and loras so open editors get deltas instead of refetching
+CATALOG_BROADCASTER.start()
 
 # 2. Mappings
 NODE_CLASS_MAPPINGS = {
@@ -0,0 +1,306 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# ==============================================================================
+# DANBOORU TAG STORE
+# ==============================================================================
+# Raw per-character tag counts plus the number of posts they were counted over.
+# Thresholds and max_tags are applied by the caller, so changing them never needs
+# another HTTP call and never reuses a list filtered for different settings.
+#
+# The same file can be filled offline from a Danbooru post dump:
+#     python danbooru_store.py import posts.jsonl.gz
+# after which char: expansion needs no network at all.
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "danbooru.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS characters (
+    name TEXT PRIMARY KEY,
+    post_count INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tag_counts (
+    name TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (name, tag)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tags (
+    name TEXT PRIMARY KEY,
+    category INTEGER NOT NULL,
+    post_count INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Tags too generic to describe a character; dropped from consensus lists and never
+# counted from dumps, so they can't take up a character's top_k slots
+CONSENSUS_TAG_BLACKLIST = frozenset({
+    "1girl", "1boy", "solo", "monochrome", "greyscale", "comic",
+    "translated", "commentary_request", "highres", "absurdres",
+    "looking_at_viewer", "smile", "open_mouth", "standing", "simple_background",
+    "white_background", "transparent_background"
+})
+
+# Staging tables for a dump import; counts are summed on disk so memory stays flat
+DUMP_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS dump_posts (
+    name TEXT PRIMARY KEY,
+    posts INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TEMP TABLE IF NOT EXISTS dump_counts (
+    name TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (name, tag)
+) WITHOUT ROWID;
+"""
+
+class DanbooruTagStore:
+    def __init__(self, db_path, memory_limit=1024):
+        self.db_path = db_path
+        self.memory_limit = memory_limit
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            # WAL lets several ComfyUI processes read while one writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self.conn = conn
+        return self.conn
+
+    def remember(self, name, record):
+        self.memory[name] = record
+        self.memory.move_to_end(name)
+        while len(self.memory) > self.memory_limit:
+            self.memory.popitem(last=False)
+
+    def get(self, name):
+        """Returns (post_count, [(tag, count), ...] most common first) or None."""
+        name = name.lower()
+        with self.lock:
+            if name in self.memory:
+                self.memory.move_to_end(name)
+                return self.memory[name]
+
+            conn = self.connect()
+            row = conn.execute("SELECT post_count FROM characters WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            counts = conn.execute(
+                "SELECT tag, count FROM tag_counts WHERE name = ? ORDER BY count DESC, tag", (name,)
+            ).fetchall()
+            record = (row[0], counts)
+            self.remember(name, record)
+            return record
+
+    def put(self, name, post_count, tag_counts, source="api"):
+        self.put_many([(name, post_count, tag_counts)], source)
+
+    def put_many(self, records, source="api"):
+        """Writes [(name, post_count, {tag: count})] in a single transaction."""
+        now = time.time()
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                for name, post_count, tag_counts in records:
+                    name = name.lower()
+                    counts = sorted(tag_counts.items(), key=lambda x: (-x[1], x[0]))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO characters (name, post_count, source, updated_at) VALUES (?, ?, ?, ?)",
+                        (name, post_count, source, now)
+                    )
+                    conn.execute("DELETE FROM tag_counts WHERE name = ?", (name,))
+                    conn.executemany(
+                        "INSERT INTO tag_counts (name, tag, count) VALUES (?, ?, ?)",
+                        [(name, tag, count) for tag, count in counts]
+                    )
+                    self.memory.pop(name, None)
+
+    def put_tags(self, rows):
+        """Writes [(tag, category, post_count)] from a tag dump, for autocomplete."""
+        with self.lock:
+            conn = self.connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO tags (name, category, post_count) VALUES (?, ?, ?)",
+                    [(name.lower(), category, post_count) for name, category, post_count in rows]
+                )
+
+    def add_dump_counts(self, post_counts, tag_counts):
+        """Adds one batch of dump counts ({name: posts}, {(name, tag): count}) to the staging tables."""
+        with self.lock:
+            conn = self.connect()
+            conn.executescript(DUMP_SCHEMA)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO dump_posts (name, posts) VALUES (?, ?) "
+                    "ON CONFLICT (name) DO UPDATE SET posts = posts + excluded.posts",
+                    post_counts.items()
+                )
+                conn.executemany(
+                    "INSERT INTO dump_counts (name, tag, count) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, tag) DO UPDATE SET count = count + excluded.count",
+                    [(name, tag, count) for (name, tag), count in tag_counts.items()]
+                )
+
+    def finish_dump(self, top_k, min_posts, min_frequency):
+        """Moves the staged dump into characters/tag_counts, keeping each character's top_k
+        tags at or above min_frequency. Returns the number of characters written."""
+        with self.lock:
+            conn = self.connect()
+            conn.executescript(DUMP_SCHEMA)
+            with conn:
+                conn.execute("DELETE FROM dump_posts WHERE posts < ?", (min_posts,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO characters (name, post_count, source, updated_at) "
+                    "SELECT name, posts, 'dump', ? FROM dump_posts",
+                    (time.time(),)
+                )
+                conn.execute("DELETE FROM tag_counts WHERE name IN (SELECT name FROM dump_posts)")
+                conn.execute(
+                    "INSERT INTO tag_counts (name, tag, count) "
+                    "SELECT name, tag, count FROM ("
+                    "  SELECT c.name, c.tag, c.count, p.posts, "
+                    "  ROW_NUMBER() OVER (PARTITION BY c.name ORDER BY c.count DESC, c.tag) AS rank "
+                    "  FROM dump_counts c JOIN dump_posts p ON p.name = c.name"
+                    ") WHERE rank <= ? AND count >= ? * posts",
+                    (top_k, min_frequency)
+                )
+                written = conn.execute("SELECT COUNT(*) FROM dump_posts").fetchone()[0]
+            conn.executescript("DROP TABLE IF EXISTS temp.dump_posts; DROP TABLE IF EXISTS temp.dump_counts;")
+            self.memory.clear()
+            return written
+
+    def search_names(self, prefix, limit=20):
+        """Characters and dump tags starting with prefix, most posts first. Both lookups are
+        range scans on the primary keys; a name in both tables is listed once."""
+        prefix = prefix.lower().replace(" ", "_")
+        upper = prefix + "\uffff"
+        with self.lock:
+            conn = self.connect()
+            rows = conn.execute(
+                "SELECT name, MAX(post_count) AS posts FROM ("
+                "SELECT name, post_count FROM characters WHERE name >= ? AND name < ? "
+                "UNION ALL SELECT name, post_count FROM tags WHERE name >= ? AND name < ?"
+                ") GROUP BY name ORDER BY posts DESC, name LIMIT ?",
+                (prefix, upper, prefix, upper, limit)
+            ).fetchall()
+        return [name for name, _ in rows]
+
+# ==============================================================================
+# OFFLINE DUMP IMPORT
+# ==============================================================================
+
+def open_dump(path):
+    if path.lower().endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+def iter_dump_rows(path):
+    """Yields dict rows from a CSV or JSON-lines dump (optionally gzipped)."""
+    base = path.lower()[:-3] if path.lower().endswith('.gz') else path.lower()
+    with open_dump(path) as f:
+        if base.endswith('.csv'):
+            csv.field_size_limit(sys.maxsize)
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def split_tags(value):
+    if isinstance(value, list):
+        return [str(t) for t in value]
+    return str(value or "").split()
+
+def import_dump(store, path, top_k=64, min_posts=3, min_frequency=0.1, progress_every=500000, batch_posts=50000):
+    """
+    Builds character -> co-occurring general tag frequencies from a post dump.
+    Only posts tagged with exactly one character are counted, mirroring the
+    "<name> solo" query used online. Each character keeps its top_k tags whose
+    frequency is at least min_frequency (the lowest danbooru_threshold the node accepts),
+    with blacklisted generic tags skipped before the cut.
+    A tag dump (name/category/post_count rows) is stored for autocomplete instead.
+    Counts are flushed to the store every batch_posts posts, so memory doesn't grow with the dump.
+    """
+    post_counts = Counter()
+    tag_counts = Counter()
+    batched = 0
+    tag_rows = []
+    tag_count = 0
+    seen = 0
+
+    for row in iter_dump_rows(path):
+        seen += 1
+        if progress_every and seen % progress_every == 0:
+            print(f"[UmiAI] Read {seen} rows from {path}...")
+
+        if 'tag_string_character' in row or 'tag_string_general' in row:
+            characters = split_tags(row.get('tag_string_character'))
+            if len(characters) != 1:
+                continue
+            character = characters[0].lower()
+            post_counts[character] += 1
+            tag_counts.update(
+                (character, tag) for tag in split_tags(row.get('tag_string_general'))
+                if tag not in CONSENSUS_TAG_BLACKLIST
+            )
+            batched += 1
+            if batched >= batch_posts:
+                store.add_dump_counts(post_counts, tag_counts)
+                post_counts.clear()
+                tag_counts.clear()
+                batched = 0
+        elif 'name' in row and 'category' in row:
+            try:
+                tag_rows.append((row['name'], int(row['category']), int(row.get('post_count') or 0)))
+            except (TypeError, ValueError):
+                continue
+            if len(tag_rows) >= batch_posts:
+                store.put_tags(tag_rows)
+                tag_count += len(tag_rows)
+                tag_rows = []
+
+    if post_counts:
+        store.add_dump_counts(post_counts, tag_counts)
+    characters = store.finish_dump(top_k, min_posts, min_frequency)
+    if tag_rows:
+        store.put_tags(tag_rows)
+        tag_count += len(tag_rows)
+
+    print(f"[UmiAI] Imported {characters} characters and {tag_count} tags from {seen} rows.")
+    return characters, tag_count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UmiAI Danbooru tag store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Import a Danbooru post or tag dump (.csv / .jsonl, optionally .gz)")
+    imp.add_argument("dump")
+    imp.add_argument("--db", default=DEFAULT_DB_PATH)
+    imp.add_argument("--top-k", type=int, default=64)
+    imp.add_argument("--min-posts", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        store = DanbooruTagStore(args.db)
+        import_dump(store, args.dump, top_k=args.top_k, min_posts=args.min_posts)
+
+if __name__ == "__main__":
+    main()
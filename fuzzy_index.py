@@ -0,0 +1,106 @@
+import heapq
+import re
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+# ==============================================================================
+# FUZZY AUTOCOMPLETE INDEX
+# ==============================================================================
+# Server-side counterpart of getFuzzyMatches in js/umi_wildcards.js. Results are
+# ranked in the same tiers (exact, prefix, substring, subsequence), but each tier is
+# answered from a prebuilt structure and only the requested page is ever sorted:
+#   prefix      -> bisect over the sorted lowercase keys
+#   substring   -> trigram posting lists, verified with `in`
+#   subsequence -> 64-bit character masks prune items before a regex check
+
+MASK_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_-/ ."
+MASK_BITS = {ch: 1 << i for i, ch in enumerate(MASK_CHARS)}
+OTHER_BIT = 1 << 63
+
+def char_mask(text):
+    return sum(MASK_BITS.get(ch, OTHER_BIT) for ch in set(text))
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class FuzzySearchIndex:
+    def __init__(self, items):
+        self.items = sorted(set(items), key=lambda x: (x.lower(), x))
+        self.lowered = [x.lower() for x in self.items]
+        self.masks = [char_mask(x) for x in self.lowered]
+        grams = defaultdict(list)
+        for i, text in enumerate(self.lowered):
+            for gram in trigrams(text):
+                grams[gram].append(i)
+        # Compact posting lists: 4 bytes per id instead of a pointer per int object
+        self.grams = {gram: array('I', ids) for gram, ids in grams.items()}
+
+    def __len__(self):
+        return len(self.items)
+
+    def prefix_ids(self, query):
+        # self.lowered is already sorted, so prefix matches are one contiguous run
+        lo = bisect_left(self.lowered, query)
+        hi = bisect_left(self.lowered, query + "\uffff", lo)
+        return range(lo, hi)
+
+    def substring_ids(self, query):
+        if len(query) < 3:
+            return (i for i, text in enumerate(self.lowered) if query in text)
+        postings = []
+        for gram in trigrams(query):
+            found = self.grams.get(gram)
+            if not found:
+                return ()
+            postings.append(found)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                return ()
+        return (i for i in candidates if query in self.lowered[i])
+
+    def search(self, query, limit=20, offset=0):
+        """Returns (items, has_more) for one page of ranked matches."""
+        query = (query or "").strip().lower()
+        want = offset + limit + 1
+
+        if not query:
+            page = self.items[offset:offset + limit]
+            return page, offset + limit < len(self.items)
+
+        ranked = []
+        taken = set()
+
+        def take(ids, key):
+            for i in heapq.nsmallest(want - len(ranked), ids, key=key):
+                ranked.append(i)
+                taken.add(i)
+
+        prefix = self.prefix_ids(query)
+        take(prefix, lambda i: (len(self.lowered[i]), self.lowered[i]))
+
+        if len(ranked) < want:
+            prefix_range = prefix
+            take(
+                (i for i in self.substring_ids(query) if i not in prefix_range),
+                lambda i: (self.lowered[i].find(query), len(self.lowered[i]), self.lowered[i])
+            )
+
+        if len(ranked) < want:
+            qmask = char_mask(query)
+            pattern = re.compile(".*?".join(re.escape(ch) for ch in query))
+            scored = []
+            for i, mask in enumerate(self.masks):
+                if mask & qmask != qmask or i in taken:
+                    continue
+                m = pattern.search(self.lowered[i])
+                if m:
+                    scored.append((m.end() - m.start(), m.start(), len(self.lowered[i]), i))
+            for entry in heapq.nsmallest(want - len(ranked), scored):
+                ranked.append(entry[3])
+
+        page = ranked[offset:offset + limit]
+        return [self.items[i] for i in page], len(ranked) > offset + limit
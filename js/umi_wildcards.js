@@ -1,4 +1,5 @@
 import { app } from "../../scripts/app.js";
+import { api } from "../../scripts/api.js";
 
 // =============================================================================
 // PART 1: AUTOCOMPLETE LOGIC (Enhanced with Fuzzy Search & Context Awareness)
@@ -353,6 +354,9 @@ function showHelpModal() {
 // PART 3: REGISTRATION & DYNAMIC VISIBILITY
 // =============================================================================
 
+// Autocomplete waits this long after the last keystroke before querying the server
+const SEARCH_DEBOUNCE_MS = 150;
+
 // Helper: Custom fuzzy search function for client-side filtering
 function getFuzzyMatches(query, allItems) {
     // FIX: If query is empty, return everything!
@@ -422,6 +426,7 @@ app.registerExtension({
                         // New structure from nodes.py
                         this.wildcards = data.wildcards || [];
                         this.loras = data.loras || [];
+                        this.catalogVersion = data.version || null;
                     }
                 } else {
                     this.wildcards = [];
@@ -434,6 +439,56 @@ app.registerExtension({
             }
         };
 
+        // Ranked matches come from the server index; the local lists are only a fallback
+        this.searchSeq = 0;
+        this.searchController = null;
+        // A newer keystroke supersedes the request in flight, so cancel it server-side too
+        this.abortSearch = () => {
+            if (this.searchController) {
+                this.searchController.abort();
+                this.searchController = null;
+            }
+        };
+        this.searchWildcards = async (kind, query, fallbackItems) => {
+            this.abortSearch();
+            const controller = new AbortController();
+            this.searchController = controller;
+            try {
+                const params = new URLSearchParams({ q: query, kind: kind, limit: "50" });
+                const resp = await fetch(`/umiapp/wildcards/search?${params}`, { signal: controller.signal });
+                if (resp.ok) {
+                    const data = await resp.json();
+                    return data.items || [];
+                }
+            } catch (e) {
+                if (e.name === "AbortError") return [];
+                console.warn("[UmiAI] Search endpoint unavailable, matching locally", e);
+            } finally {
+                if (this.searchController === controller) this.searchController = null;
+            }
+            return getFuzzyMatches(query, fallbackItems);
+        };
+
+        // Server pushes add/remove deltas when wildcard or LoRA files change.
+        // Patch in place when we hold the version the delta starts from, otherwise refetch.
+        this.catalogVersion = null;
+        const applyDelta = (list, delta) => {
+            if (!delta) return list;
+            const removed = new Set(delta.removed || []);
+            const merged = list.filter(x => !removed.has(x)).concat(delta.added || []);
+            return Array.from(new Set(merged)).sort();
+        };
+        api.addEventListener("umi.catalog.delta", ({ detail }) => {
+            if (!detail) return;
+            if (detail.resync || detail.from_version !== this.catalogVersion) {
+                this.fetchWildcards();
+                return;
+            }
+            this.wildcards = applyDelta(this.wildcards, detail.wildcards);
+            this.loras = applyDelta(this.loras, detail.loras);
+            this.catalogVersion = detail.version;
+        });
+
         // Initial fetch
         await this.fetchWildcards();
         this.popup = new AutoCompletePopup();
@@ -474,9 +529,15 @@ app.registerExtension({
                 fetch("/umiapp/refresh", { method: "POST" })
                     .then(r => r.json())
                     .then(data => {
-                        // Re-fetch the autocomplete list in JS to match Python
+                        // The refresh response already carries the full lists
                         const ext = app.extensions.find(e => e.name === "UmiAI.WildcardSystem");
-                        if(ext && ext.fetchWildcards) ext.fetchWildcards();
+                        if (ext && data.wildcards) {
+                            ext.wildcards = data.wildcards;
+                            ext.loras = data.loras || [];
+                            ext.catalogVersion = data.version || null;
+                        } else if (ext && ext.fetchWildcards) {
+                            ext.fetchWildcards();
+                        }
                         
                         // Visual feedback: Success
                         if(btn) {
@@ -579,10 +640,7 @@ app.registerExtension({
             });
 
             // 2. LISTEN FOR TYPING (To show the popup)
-            inputEl.addEventListener("keyup", (e) => {
-                // Ignore nav keys in this listener to prevent flashing
-                if (["ArrowUp", "ArrowDown", "Enter", "Escape"].includes(e.key)) return;
-
+            const updateSuggestions = async () => {
                 const cursor = inputEl.selectionStart;
                 const text = inputEl.value;
                 const beforeCursor = text.substring(0, cursor);
@@ -596,6 +654,8 @@ app.registerExtension({
 
                 if (!ext) return;
 
+                // Responses can arrive out of order; only the latest keystroke may show a popup
+                const seq = ++ext.searchSeq;
                 let options = [];
                 let triggerType = ""; 
                 let matchIndex = 0;
@@ -610,7 +670,7 @@ app.registerExtension({
                     matchIndex = matchFile.index;
                     
                     // FUZZY SEARCH IMPLEMENTATION
-                    options = getFuzzyMatches(query, ext.wildcards);
+                    options = await ext.searchWildcards("wildcard", query, ext.wildcards);
 
                 } 
                 // -- LoRA Logic --
@@ -620,9 +680,11 @@ app.registerExtension({
                     matchIndex = matchLora.index;
                     
                     // Use fuzzy matching on the fetched LoRA list
-                    options = getFuzzyMatches(query, ext.loras); 
+                    options = await ext.searchWildcards("lora", query, ext.loras);
                 }
 
+                if (seq !== ext.searchSeq) return;
+
                 if (triggerType && options.length > 0) {
                     const rect = inputEl.getBoundingClientRect();
                     const topOffset = rect.top + 20 + (rect.height / 2); // Approximate pos
@@ -659,6 +721,20 @@ app.registerExtension({
                 } else {
                     ext.popup.hide();
                 }
+            };
+
+            // Search once typing pauses instead of on every keystroke
+            let searchTimer = null;
+            inputEl.addEventListener("keyup", (e) => {
+                // Ignore nav keys in this listener to prevent flashing
+                if (["ArrowUp", "ArrowDown", "Enter", "Escape"].includes(e.key)) return;
+
+                if (ext) {
+                    ext.searchSeq++;
+                    ext.abortSearch();
+                }
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(updateSuggestions, SEARCH_DEBOUNCE_MS);
             });
 
             // Close on outside click
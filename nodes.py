@@ -1,4 +1,5 @@
 import os
+import asyncio
 import random
 import re
 import yaml
@@ -6,11 +7,21 @@ import glob
 import json
 import csv
 import requests
+from requests.adapters import HTTPAdapter
 import fnmatch
-import gc 
+import gc
 import sys
 import subprocess
+import struct
+import threading
+import weakref
+import atexit
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from collections import Counter, OrderedDict
+from collections.abc import Mapping
+from types import MappingProxyType
 import folder_paths
 import comfy.sd
 import comfy.utils
@@ -27,14 +38,16 @@ from PIL import Image
 import server
 from aiohttp import web
 
+from .fuzzy_index import FuzzySearchIndex
+from .shared_catalog import (
+    CODEC_JSON, CODEC_NONE, CODEC_STR, MappedSet, MappedTable, RawTable, SharedCatalogStore,
+    file_lock, parsed, stamps_digest,
+)
+from .danbooru_store import CONSENSUS_TAG_BLACKLIST, DanbooruTagStore, DEFAULT_DB_PATH as DANBOORU_DB_PATH
+
 # ==============================================================================
-# GLOBAL CACHE & SETUP
+# GLOBAL SETUP
 # ==============================================================================
-GLOBAL_CACHE = {}
-GLOBAL_INDEX = {'built': False, 'files': set(), 'entries': {}, 'tags': set()} 
-
-# LRU CACHE
-LORA_MEMORY_CACHE = OrderedDict()
 
 # REGISTER LLM FOLDER
 folder_paths.add_model_folder_path("llm", os.path.join(folder_paths.models_dir, "llm"))
@@ -192,6 +205,24 @@ def is_valid_image(image_input):
         return True
     return False
 
+def image_to_data_url(image_input):
+    # Convert Tensor (Batch, H, W, C) -> PIL -> Base64
+    i = 255. * image_input[0].cpu().numpy()
+    img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+    
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG")
+    img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return f"data:image/jpeg;base64,{img_str}"
+
+def build_vision_messages(image_url, instruction):
+    # GENERIC PROMPT FOR VISION (Just get the data)
+    user_content = [
+        {"type": "image_url", "image_url": {"url": image_url}},
+        {"type": "text", "text": instruction}
+    ]
+    return [{"role": "user", "content": user_content}]
+
 def parse_tag(tag):
     if tag is None:
         return ""
@@ -261,34 +292,1492 @@ def process_wildcard_range(tag, lines, rng):
         return selected
 
 def get_all_wildcard_paths():
-    paths = set()
+    # Ordered, so every process (and every run) resolves names across roots the same way
+    paths = {}
     internal_path = os.path.join(os.path.dirname(__file__), "wildcards")
     if os.path.exists(internal_path):
-        paths.add(internal_path)
+        paths[internal_path] = None
     
     root_wildcards = os.path.join(folder_paths.base_path, "wildcards")
     if os.path.exists(root_wildcards):
-        paths.add(root_wildcards)
+        paths[root_wildcards] = None
 
     models_wildcards = os.path.join(folder_paths.models_dir, "wildcards")
     if os.path.exists(models_wildcards):
-        paths.add(models_wildcards)
+        paths[models_wildcards] = None
 
     try:
         ext_paths = folder_paths.get_folder_paths("wildcards")
         if ext_paths:
             for p in ext_paths:
                 if os.path.exists(p):
-                    paths.add(p)
+                    paths[p] = None
     except:
         pass
     
     return list(paths)
 
+# ==============================================================================
+# GGUF MODEL REGISTRY
+# ==============================================================================
+
+GGUF_MAGIC = b"GGUF"
+GGUF_TYPE_STRING = 8
+GGUF_TYPE_ARRAY = 9
+GGUF_SCALAR_FORMATS = {
+    0: '<B', 1: '<b', 2: '<H', 3: '<h', 4: '<I', 5: '<i',
+    6: '<f', 7: '<?', 10: '<Q', 11: '<q', 12: '<d'
+}
+
+def read_gguf_metadata(path):
+    """Reads the key/value header of a GGUF file. Tensor data is never touched and
+    array values (tokenizer vocab, merges...) are skipped rather than decoded."""
+    with open(path, 'rb') as f:
+        if f.read(4) != GGUF_MAGIC:
+            return None
+        version = struct.unpack('<I', f.read(4))[0]
+        # GGUF v1 used 32-bit counts and string lengths, v2+ use 64-bit
+        len_fmt = '<I' if version == 1 else '<Q'
+        len_size = struct.calcsize(len_fmt)
+
+        def read_len():
+            return struct.unpack(len_fmt, f.read(len_size))[0]
+
+        def read_string():
+            return f.read(read_len()).decode('utf-8', errors='replace')
+
+        def read_scalar(value_type):
+            fmt = GGUF_SCALAR_FORMATS[value_type]
+            return struct.unpack(fmt, f.read(struct.calcsize(fmt)))[0]
+
+        def skip_array():
+            item_type = struct.unpack('<I', f.read(4))[0]
+            count = read_len()
+            if item_type in GGUF_SCALAR_FORMATS:
+                f.seek(count * struct.calcsize(GGUF_SCALAR_FORMATS[item_type]), os.SEEK_CUR)
+            elif item_type == GGUF_TYPE_STRING:
+                for _ in range(count):
+                    f.seek(read_len(), os.SEEK_CUR)
+            elif item_type == GGUF_TYPE_ARRAY:
+                for _ in range(count):
+                    skip_array()
+            else:
+                raise ValueError(f"Unknown GGUF array type {item_type}")
+
+        read_len()  # tensor count
+        kv_count = read_len()
+
+        metadata = {}
+        for _ in range(kv_count):
+            key = read_string()
+            value_type = struct.unpack('<I', f.read(4))[0]
+            if value_type == GGUF_TYPE_STRING:
+                metadata[key] = read_string()
+            elif value_type == GGUF_TYPE_ARRAY:
+                skip_array()
+            elif value_type in GGUF_SCALAR_FORMATS:
+                metadata[key] = read_scalar(value_type)
+            else:
+                raise ValueError(f"Unknown GGUF value type {value_type}")
+        return metadata
+
+def detect_prompt_format(chat_template):
+    if not chat_template:
+        return None
+    if "<|start_header_id|>" in chat_template:
+        return "llama3"
+    if "<|im_start|>" in chat_template:
+        return "chatml"
+    if "[INST]" in chat_template:
+        return "mistral"
+    return "other"
+
+def common_prefix_length(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+class GGUFModelRegistry:
+    """
+    Cached view of the llm folders. Headers are parsed once per (size, mtime) and
+    folder listings are only redone when a directory mtime changes.
+    """
+    MIN_PAIR_PREFIX = 5
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.names = {}
+        self.dir_stamps = None
+        self.projector_pairs = {}
+
+    def get_folders(self):
+        folders = []
+        try:
+            folders = list(folder_paths.get_folder_paths("llm"))
+        except Exception:
+            pass
+        default_folder = os.path.join(folder_paths.models_dir, "llm")
+        if default_folder not in folders:
+            folders.append(default_folder)
+        return [f for f in folders if os.path.isdir(f)]
+
+    def current_dir_stamps(self):
+        stamps = []
+        for folder in self.get_folders():
+            for root, dirs, files in os.walk(folder):
+                try:
+                    stamps.append((root, os.stat(root).st_mtime_ns))
+                except OSError:
+                    pass
+        return tuple(stamps)
+
+    def rescan(self):
+        with self.lock:
+            stamps = self.current_dir_stamps()
+            if stamps == self.dir_stamps:
+                return
+            names = {}
+            for folder in self.get_folders():
+                for root, dirs, files in os.walk(folder):
+                    for file in files:
+                        if not file.lower().endswith('.gguf'):
+                            continue
+                        full_path = os.path.join(root, file)
+                        name = os.path.relpath(full_path, folder).replace(os.sep, '/')
+                        names.setdefault(name, full_path)
+            self.names = names
+            live_paths = set(names.values())
+            self.entries = {p: e for p, e in self.entries.items() if p in live_paths}
+            self.projector_pairs = {}
+            self.dir_stamps = stamps
+
+    def get(self, path):
+        """Returns the header info for a model file, re-reading it if it changed on disk."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+                return entry
+
+            try:
+                metadata = read_gguf_metadata(path) or {}
+            except Exception as e:
+                print(f"[UmiAI] Could not read GGUF header of {path}: {e}")
+                metadata = {}
+
+            arch = metadata.get('general.architecture')
+            file_name = os.path.basename(path)
+            is_projector = (
+                arch == 'clip'
+                or metadata.get('general.type') == 'mmproj'
+                or any(k.startswith('clip.') for k in metadata)
+                or (not metadata and 'mmproj' in file_name.lower())
+            )
+            chat_template = metadata.get('tokenizer.chat_template')
+            entry = {
+                'path': path,
+                'file_name': file_name,
+                'mtime': st.st_mtime_ns,
+                'size': st.st_size,
+                'has_metadata': bool(metadata),
+                'architecture': arch,
+                'model_name': metadata.get('general.name'),
+                'chat_template': chat_template,
+                'context_length': metadata.get(f"{arch}.context_length") if arch else None,
+                'projector_type': metadata.get('clip.projector_type'),
+                'image_size': metadata.get('clip.vision.image_size'),
+                'patch_size': metadata.get('clip.vision.patch_size'),
+                'patch_merge_type': metadata.get('clip.vision.mm_patch_merge_type'),
+                'is_projector': is_projector,
+                'prompt_format': detect_prompt_format(chat_template),
+            }
+            self.entries[path] = entry
+            self.projector_pairs.pop(path, None)
+            return entry
+
+    def model_names(self):
+        """Selectable (non-projector) models, for the node dropdowns."""
+        self.rescan()
+        with self.lock:
+            result = []
+            for name, path in self.names.items():
+                entry = self.get(path)
+                if entry and not entry['is_projector']:
+                    result.append(name)
+            return sorted(result)
+
+    def resolve(self, model_choice):
+        self.rescan()
+        with self.lock:
+            path = self.names.get(model_choice)
+        if path:
+            return path
+        path = folder_paths.get_full_path("llm", model_choice) if "llm" in folder_paths.folder_names_and_paths else None
+        if path:
+            return path
+        potential = os.path.join(folder_paths.models_dir, "llm", model_choice)
+        return potential if os.path.exists(potential) else None
+
+    def find_projector(self, model_path):
+        """Pairs a language model with the vision projector sitting next to it."""
+        self.rescan()
+        with self.lock:
+            if model_path in self.projector_pairs:
+                return self.projector_pairs[model_path]
+
+            folder = os.path.dirname(model_path)
+            base = os.path.splitext(model_path)[0]
+            # Exact name pairs used by the common GGUF uploaders
+            candidates = [
+                base + "-mmproj.gguf",
+                base + ".mmproj.gguf",
+                base + "-vision.gguf",
+                base.replace("Q4_K_M", "mmproj-f16") + ".gguf",
+                base.replace("Q6_K", "mmproj-f16") + ".gguf",
+                base.replace("Q4_K", "mmproj-Q4_0") + ".gguf",
+            ]
+            projector = None
+            for c in candidates:
+                if c != model_path and os.path.exists(c):
+                    projector = c
+                    break
+
+            # Otherwise pick the projector in the same folder sharing the longest name prefix
+            if not projector:
+                model_entry = self.get(model_path) or {}
+                model_file = os.path.basename(model_path).lower()
+                model_title = (model_entry.get('model_name') or "").lower()
+                best_score = 0
+                for path in self.names.values():
+                    if os.path.dirname(path) != folder or path == model_path:
+                        continue
+                    entry = self.get(path)
+                    if not entry or not entry['is_projector']:
+                        continue
+                    score = common_prefix_length(model_file, entry['file_name'].lower())
+                    if model_title and entry['model_name']:
+                        score = max(score, common_prefix_length(model_title, entry['model_name'].lower()))
+                    if score >= self.MIN_PAIR_PREFIX and score > best_score:
+                        best_score = score
+                        projector = path
+
+            self.projector_pairs[model_path] = projector
+            return projector
+
+    def prompt_format(self, model_path, model_choice=""):
+        entry = self.get(model_path)
+        if entry and entry['has_metadata']:
+            return entry['prompt_format']
+        # Header unreadable: fall back to the old filename guess
+        name = str(model_choice or model_path).lower()
+        if "dolphin" in name or "llama" in name or "imp" in name or "joycaption" in name:
+            return "llama3"
+        return None
+
+    def image_tokens(self, mmproj_path):
+        """Upper estimate of the tokens one image costs with this projector."""
+        entry = self.get(mmproj_path) if mmproj_path else None
+        if not entry or not entry.get('image_size') or not entry.get('patch_size'):
+            return VISION_IMAGE_TOKENS
+        per_tile = (int(entry['image_size']) // int(entry['patch_size'])) ** 2
+        # LLaVA-1.6 "anyres" encodes a base image plus up to four high-res crops
+        if entry.get('patch_merge_type') == 'spatial_unpad':
+            return per_tile * VISION_ANYRES_TILES
+        return max(per_tile, VISION_IMAGE_TOKENS)
+
+    def context_size(self, model_path, requested):
+        entry = self.get(model_path)
+        trained = entry.get('context_length') if entry else None
+        if trained:
+            return min(requested, int(trained))
+        return requested
+
+GGUF_REGISTRY = GGUFModelRegistry()
+
+# ==============================================================================
+# LLM EXECUTION PROFILES
+# ==============================================================================
+
+LLM_PROFILES = ["Auto", "GPU", "CPU"]
+VISION_IMAGE_TOKENS = 768
+VISION_ANYRES_TILES = 5
+# The fixed n_ctx used before contexts were sized per call. The estimate below can only be
+# rough (CJK and tag-heavy text, chat templates, dynamic-resolution projectors like
+# Qwen2-VL), so it only ever grows the context past this, never shrinks it
+MIN_LLM_CONTEXT = 4096
+# GPU instances are freed after every run unless this is set: two resident n_gpu_layers=-1
+# models next to the diffusion model would OOM most consumer cards
+LLM_KEEP_GPU_RESIDENT = os.environ.get("UMIAI_LLM_KEEP_GPU", "0") == "1"
+
+def resolve_llm_profile(profile):
+    if profile == "Auto":
+        try:
+            return "GPU" if torch.cuda.is_available() else "CPU"
+        except Exception:
+            return "CPU"
+    return profile if profile in LLM_PROFILES else "GPU"
+
+def llm_gpu_layers(profile):
+    return 0 if profile == "CPU" else -1
+
+def get_cpu_core_counts():
+    """Returns (physical, logical) cores usable by this process."""
+    try:
+        logical = len(os.sched_getaffinity(0))
+    except AttributeError:
+        logical = os.cpu_count() or 1
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False) or logical
+    except ImportError:
+        # Assume SMT: two hardware threads per core
+        physical = logical // 2 if logical > 2 else logical
+    return max(1, min(physical, logical)), max(1, logical)
+
+def estimate_context_size(prompt_text, max_tokens, image_tokens=0):
+    """Sizes n_ctx to prompt + max_tokens, rounded up to a power of two so pooled instances
+    can be reused across similar prompts. Counting ~2 UTF-8 bytes per token overestimates
+    English and stays safe for CJK (3 bytes per character, often one token or more each)."""
+    needed = len(prompt_text.encode('utf-8', errors='replace')) // 2 + image_tokens + max_tokens + 256
+    n_ctx = MIN_LLM_CONTEXT
+    while n_ctx < needed:
+        n_ctx *= 2
+    return n_ctx
+
+def build_llama_kwargs(profile, n_ctx):
+    if profile == "CPU":
+        physical, logical = get_cpu_core_counts()
+        return {
+            'n_ctx': n_ctx,
+            'n_gpu_layers': llm_gpu_layers(profile),
+            # Generation is memory bound and scales with physical cores; prompt eval uses all of them
+            'n_threads': physical,
+            'n_threads_batch': logical,
+            'n_batch': min(n_ctx, max(64, min(512, 32 * physical))),
+            # Weights stay mmap'd so every pooled instance shares the same page cache
+            'use_mmap': True,
+            'use_mlock': False,
+            'verbose': False,
+        }
+    return {'n_ctx': n_ctx, 'n_gpu_layers': llm_gpu_layers(profile), 'verbose': True}
+
+class LLMInstancePool:
+    """Idle Llama instances kept warm for the CPU profile (and for GPU ones only with
+    UMIAI_LLM_KEEP_GPU=1). An instance is checked out for exclusive use; concurrent callers
+    get their own instance backed by the same mmap. Instances built with a different
+    n_gpu_layers are never handed out for each other."""
+    def __init__(self, limit=2):
+        self.limit = limit
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def checkout(self, model_path, mmproj_path, n_ctx, gpu_layers):
+        with self.lock:
+            for i in range(len(self.idle) - 1, -1, -1):
+                path, proj, layers, ctx, llm = self.idle[i]
+                if path == model_path and proj == mmproj_path and layers == gpu_layers and ctx >= n_ctx:
+                    del self.idle[i]
+                    return llm
+        return None
+
+    def checkin(self, model_path, mmproj_path, gpu_layers, llm):
+        with self.lock:
+            self.idle.append((model_path, mmproj_path, gpu_layers, llm.n_ctx(), llm))
+            while len(self.idle) > self.limit:
+                self.idle.pop(0)
+
+    def evict_gpu(self):
+        """Drops idle GPU-offloaded instances so their VRAM can be reclaimed."""
+        with self.lock:
+            kept = [entry for entry in self.idle if entry[2] == 0]
+            dropped = len(self.idle) - len(kept)
+            self.idle = kept
+        return dropped
+
+    def clear(self):
+        with self.lock:
+            self.idle = []
+
+LLM_POOL = LLMInstancePool()
+
+# ==============================================================================
+# OPENAI-COMPATIBLE LLM BACKEND
+# ==============================================================================
+
+LLM_BACKEND_LOCAL = "llama.cpp (in-process)"
+LLM_BACKEND_SERVER = "OpenAI-compatible server"
+LLM_BACKENDS = [LLM_BACKEND_LOCAL, LLM_BACKEND_SERVER]
+DEFAULT_LLM_ENDPOINT = "http://127.0.0.1:8080/v1"
+
+class OpenAICompatibleClient:
+    """
+    Talks to a local OpenAI-compatible server (llama-server, LM Studio, vLLM...), so many
+    ComfyUI workers can share one resident model. One keep-alive session is shared by
+    every node, and its connection pool is reused across requests.
+    """
+    def __init__(self, pool_size=8, connect_timeout=3.0, read_timeout=300.0):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = None
+        self.lock = threading.Lock()
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=1)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Connection": "keep-alive", "User-Agent": "ComfyUI-UmiAI/1.0"})
+                api_key = os.environ.get("UMIAI_LLM_API_KEY")
+                if api_key:
+                    session.headers["Authorization"] = f"Bearer {api_key}"
+                self.session = session
+            return self.session
+
+    def chat(self, endpoint, model, messages, temperature, max_tokens):
+        url = endpoint.rstrip("/") + "/chat/completions"
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        response = self.get_session().post(url, json=payload, timeout=(self.connect_timeout, self.read_timeout))
+        response.raise_for_status()
+        return response.json()['choices'][0]['message']['content'].strip()
+
+    def chat_stream(self, endpoint, model, messages, temperature, max_tokens, deadline):
+        """Streams the completion and stops reading once the deadline passes.
+        Returns (text, truncated); raises requests.Timeout if nothing arrives in time."""
+        url = endpoint.rstrip("/") + "/chat/completions"
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        remaining = max(0.05, deadline - time.monotonic())
+        response = self.get_session().post(url, json=payload, stream=True, timeout=(min(self.connect_timeout, remaining), remaining))
+        try:
+            response.raise_for_status()
+            parts = []
+            truncated = False
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith("data:"):
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        delta = json.loads(data)['choices'][0].get('delta', {})
+                        if delta.get('content'):
+                            parts.append(delta['content'])
+                    if time.monotonic() >= deadline:
+                        truncated = True
+                        break
+            except requests.ConnectionError:
+                # A read timeout mid-stream surfaces as a ConnectionError
+                if time.monotonic() < deadline:
+                    raise
+                if not parts:
+                    raise requests.Timeout("No tokens received within the latency budget")
+                truncated = True
+            return "".join(parts).strip(), truncated
+        finally:
+            response.close()
+
+LLM_HTTP_CLIENT = OpenAICompatibleClient()
+
+# ==============================================================================
+# LLM LATENCY BUDGET
+# ==============================================================================
+
+LLM_RESULT_CACHE = OrderedDict()
+LLM_RESULT_CACHE_LIMIT = 256
+LLM_RESULT_LOCK = threading.Lock()
+
+# Loads that miss their deadline keep running here and park the instance in LLM_POOL
+LLM_LOADER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="UmiAI-LLM-Load")
+LLM_PENDING_LOADS = {}
+LLM_PENDING_LOCK = threading.Lock()
+
+def llm_result_key(stage, model, instruction, content):
+    h = hashlib.sha1()
+    for part in (stage, model, instruction, content):
+        h.update(str(part).encode('utf-8', errors='replace'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def remember_llm_result(key, result):
+    if not result:
+        return
+    with LLM_RESULT_LOCK:
+        LLM_RESULT_CACHE.pop(key, None)
+        LLM_RESULT_CACHE[key] = result
+        while len(LLM_RESULT_CACHE) > LLM_RESULT_CACHE_LIMIT:
+            LLM_RESULT_CACHE.popitem(last=False)
+
+def recall_llm_result(key):
+    with LLM_RESULT_LOCK:
+        return LLM_RESULT_CACHE.get(key)
+
+class LLMRunSettings:
+    """
+    LLM options and the llm_info log of one render, passed down explicitly so concurrent
+    renders through the same node never share them. The latency budget is checked before
+    a generation starts and between streamed tokens; llama_cpp can't interrupt the prompt
+    evaluation that precedes the first token, so a long prompt can overshoot it by that much.
+    """
+    def __init__(self, profile="Auto", backend=LLM_BACKEND_LOCAL, endpoint=DEFAULT_LLM_ENDPOINT, latency_budget=0.0):
+        self.profile = profile
+        self.backend = backend
+        self.endpoint = endpoint or DEFAULT_LLM_ENDPOINT
+        # 0 disables the budget; otherwise LLM/Vision work must finish this many seconds after the run starts
+        self.deadline = time.monotonic() + latency_budget if latency_budget > 0 else None
+        self.events = []
+
+    def note(self, message):
+        print(f"[UmiAI] {message}")
+        self.events.append(message)
+
+    def fallback(self, stage, cache_key, raw, reason):
+        cached = recall_llm_result(cache_key)
+        if cached:
+            self.note(f"{stage}: {reason}, fell back to cached result")
+            return cached
+        self.note(f"{stage}: {reason}, fell back to raw text")
+        return raw
+
+    def budget_exhausted(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+def collect_stream(chunks, deadline, is_chat):
+    """Drains a llama_cpp streaming generator until it finishes or the deadline passes."""
+    parts = []
+    truncated = False
+    try:
+        for chunk in chunks:
+            choice = chunk['choices'][0]
+            piece = choice.get('delta', {}).get('content') if is_chat else choice.get('text')
+            if piece:
+                parts.append(piece)
+            if time.monotonic() >= deadline:
+                truncated = True
+                break
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return "".join(parts).strip(), truncated
+
+def release_gpu_instances():
+    if LLM_POOL.evict_gpu():
+        gc.collect()
+        torch.cuda.empty_cache()
+
+def checkout_llm_within(model_path, mmproj_path, n_ctx, gpu_layers, factory, deadline, keep=True):
+    """
+    Returns a checked-out instance, or None if it could not be loaded before the deadline.
+    A load that misses the deadline finishes in the background and parks its instance in
+    LLM_POOL for the next run; with keep=False (GPU without UMIAI_LLM_KEEP_GPU) it is freed.
+    """
+    llm = LLM_POOL.checkout(model_path, mmproj_path, n_ctx, gpu_layers)
+    if llm is not None:
+        return llm
+
+    key = (model_path, mmproj_path, n_ctx, gpu_layers)
+    with LLM_PENDING_LOCK:
+        future = LLM_PENDING_LOADS.get(key)
+        if future is None:
+            def _load():
+                try:
+                    LLM_POOL.checkin(model_path, mmproj_path, gpu_layers, factory())
+                finally:
+                    with LLM_PENDING_LOCK:
+                        LLM_PENDING_LOADS.pop(key, None)
+            future = LLM_LOADER.submit(_load)
+            LLM_PENDING_LOADS[key] = future
+
+    try:
+        future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        if not keep:
+            future.add_done_callback(lambda _: release_gpu_instances())
+        return None
+    return LLM_POOL.checkout(model_path, mmproj_path, n_ctx, gpu_layers)
+
 # ==============================================================================
 # CORE CLASSES
 # ==============================================================================
 
+# ==============================================================================
+# WILDCARD CATALOG
+# ==============================================================================
+
+TAG_CACHE_BUDGET_MB = float(os.environ.get("UMIAI_TAG_CACHE_MB", "256"))
+TAG_CACHE_HOT_KEYS = 200
+
+def estimate_nbytes(value, depth=0):
+    """Rough in-memory size of a loaded wildcard value (lists of str, CSV row dicts)."""
+    size = sys.getsizeof(value)
+    if depth > 3:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sys.getsizeof(k) + estimate_nbytes(v, depth + 1)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            size += estimate_nbytes(item, depth + 1)
+    return size
+
+class TagValueCache:
+    """
+    Loaded wildcard values keyed by the lowercased tag (lookups are case-insensitive, so
+    __Color__ and __color__ share one entry), each remembering the file it came from.
+    Bounded by an approximate byte budget with LRU eviction; keys in the usage hot set
+    are evicted only once nothing colder is left.
+    """
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hot = frozenset()
+        self.hot_checked = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def canonical(tag):
+        return tag.strip().lower()
+
+    def get(self, tag):
+        """(value, source_path) or None."""
+        key = self.canonical(tag)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[2]
+
+    def put(self, tag, value, source_path, snapshot=None):
+        key = self.canonical(tag)
+        nbytes = estimate_nbytes(value)
+        with self.lock:
+            # A value read through a superseded catalog snapshot may predate the invalidation
+            # that followed the swap; checked under the lock so it can't slip in after it
+            if snapshot is not None and snapshot is not WILDCARD_CATALOG.snapshot:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            if nbytes > self.budget_bytes:
+                return
+            self.entries[key] = (value, nbytes, source_path)
+            self.used_bytes += nbytes
+            self.evict()
+
+    def refresh_hot(self):
+        now = time.monotonic()
+        if now - self.hot_checked < USAGE_FLUSH_INTERVAL:
+            return
+        self.hot_checked = now
+        try:
+            self.hot = frozenset(WILDCARD_USAGE.hot_keys(TAG_CACHE_HOT_KEYS))
+        except Exception:
+            self.hot = frozenset()
+
+    def evict(self):
+        if self.used_bytes <= self.budget_bytes:
+            return
+        self.refresh_hot()
+        for spare_hot in (True, False):
+            for key in list(self.entries.keys()):
+                if self.used_bytes <= self.budget_bytes:
+                    return
+                if spare_hot and key in self.hot:
+                    continue
+                _, nbytes, _ = self.entries.pop(key)
+                self.used_bytes -= nbytes
+                self.evictions += 1
+
+    def invalidate(self, paths=None):
+        """Drops values read from `paths`, or everything when paths is None."""
+        with self.lock:
+            if paths is None:
+                self.entries.clear()
+                self.used_bytes = 0
+                return
+            for key in [k for k, entry in self.entries.items() if entry[2] in paths]:
+                self.used_bytes -= self.entries.pop(key)[1]
+
+    def set_budget(self, budget_bytes):
+        with self.lock:
+            self.budget_bytes = budget_bytes
+            self.evict()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'used_mb': round(self.used_bytes / 2**20, 2),
+                'budget_mb': round(self.budget_bytes / 2**20, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hot_resident': sum(1 for k in self.hot if k in self.entries),
+            }
+
+GLOBAL_CACHE = TagValueCache(int(TAG_CACHE_BUDGET_MB * 2**20))
+
+def cache_tag_value(requested_tag, value, source_path, snapshot=None):
+    GLOBAL_CACHE.put(requested_tag, value, source_path, snapshot)
+
+def invalidate_tag_cache(paths=None):
+    """Drops cached tag values read from `paths`, or everything when paths is None."""
+    GLOBAL_CACHE.invalidate(paths)
+
+def frozen_mapping(value):
+    # Proxies and mapped tables are already read-only and are kept without a copy
+    if isinstance(value, (MappingProxyType, MappedTable)):
+        return value
+    return MappingProxyType(dict(value or {}))
+
+def frozen_set(value):
+    if isinstance(value, (frozenset, MappedSet)):
+        return value
+    return frozenset(value)
+
+class CatalogSnapshot:
+    """
+    One fully built, read-only view of the catalog. Lookups are mapping proxies (or tables
+    of the shared catalog file) and the index sets are frozensets; the parsed YAML they
+    point at is never mutated after a scan.
+    """
+    __slots__ = (
+        'epoch', 'version', 'structure_version', 'index_version', 'roots', 'stamps', 'yaml_data',
+        'txt_lookup', 'yaml_lookup', 'csv_lookup', 'files_index', 'yaml_entries', 'entry_tags',
+        'umi_tags', 'globals', 'loras',
+    )
+
+    def __init__(self, epoch, version=0, structure_version=0, index_version=0, roots=(),
+                 stamps=None, yaml_data=None, txt_lookup=None, yaml_lookup=None, csv_lookup=None,
+                 files_index=(), yaml_entries=None, entry_tags=None, umi_tags=(), globals=None, loras=()):
+        self.epoch = epoch
+        self.version = version
+        # Bumps only when files appear, disappear or change which name they resolve
+        self.structure_version = structure_version
+        # Bumps only when the merged index (names, tagged YAML entries, tags) differs
+        self.index_version = index_version
+        self.roots = tuple(roots)
+        self.stamps = frozen_mapping(stamps)
+        self.yaml_data = frozen_mapping(yaml_data)
+        self.txt_lookup = frozen_mapping(txt_lookup)
+        self.yaml_lookup = frozen_mapping(yaml_lookup)
+        self.csv_lookup = frozen_mapping(csv_lookup)
+        self.files_index = frozen_set(files_index)
+        self.yaml_entries = frozen_mapping(yaml_entries)
+        # title -> tags of every tagged entry; what <[tag]> selection scans
+        self.entry_tags = frozen_mapping(entry_tags)
+        self.umi_tags = frozen_set(umi_tags)
+        self.globals = frozen_mapping(globals)
+        self.loras = tuple(loras)
+
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return CatalogSnapshot(**fields)
+
+    def etag(self):
+        return f"{self.epoch}-{self.version}"
+
+    def globals_paths(self):
+        return [p for p in (os.path.join(root, 'globals.yaml') for root in self.roots) if p in self.stamps]
+
+    def entry_for(self, title):
+        """YAML entry details for a title, as TagLoader.get_entry_details looks them up."""
+        if title and isinstance(title, str) and title.lower() in self.yaml_entries:
+            return self.yaml_entries[title.lower()]
+        return self.yaml_entries.get(title) if isinstance(title, str) else None
+
+    def source_of(self, key):
+        """The file a lower-cased wildcard key is read from, in TagLoader.read_tags order, or None."""
+        for lookup in (self.txt_lookup, self.csv_lookup, self.yaml_lookup):
+            if key in lookup:
+                return lookup[key]
+        parts = key.split('/')
+        for i in range(len(parts) - 1, 0, -1):
+            prefix = "/".join(parts[:i])
+            if prefix in self.yaml_lookup:
+                return self.yaml_lookup[prefix]
+        return None
+
+class WildcardCatalog:
+    """
+    One incremental scan of every wildcard root, shared by the node and the HTTP API.
+    A refresh is a directory walk plus stats; a file is only re-read when its size or
+    mtime changes. `version` increases whenever files, their contents or the LoRA list
+    change, and `epoch` tells versions from different server runs apart.
+
+    Readers take `catalog.snapshot` without any lock: a rebuild happens on private state
+    under `write_lock` and is published with a single attribute assignment, so a reader
+    holds either the old snapshot or the new one, never a half-built mix.
+
+    With a SharedCatalogStore, one process at a time compiles the catalog into a file
+    that every process on the host maps read-only; the snapshot then points into that
+    mapping and this process keeps no parsed YAML of its own.
+    """
+    def __init__(self, shared=None):
+        # Serializes writers only; readers never take it
+        self.write_lock = threading.Lock()
+        self.snapshot = CatalogSnapshot(f"{int(time.time()):x}")
+        self.last_scan = 0.0
+        # Writer-private state behind the published snapshot
+        self.stamps = {}
+        self.yaml_data = {}
+        self.contributions = {}
+        self.listeners = []
+        self.shared = shared
+        self.mapped = None
+        self.forced = False
+
+    @property
+    def epoch(self):
+        return self.snapshot.epoch
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def etag(self):
+        return self.snapshot.etag()
+
+    def scan(self, roots):
+        txt_lookup, yaml_lookup, csv_lookup, stamps = {}, {}, {}, {}
+        for location in roots:
+            if not os.path.exists(location):
+                continue
+            for root, dirs, files in os.walk(location):
+                for file in files:
+                    name_lower = file.lower()
+                    if name_lower.endswith('.txt'):
+                        lookup = txt_lookup
+                    elif name_lower.endswith('.yaml'):
+                        lookup = yaml_lookup
+                    elif name_lower.endswith('.csv'):
+                        lookup = csv_lookup
+                    else:
+                        continue
+                    full_path = os.path.join(root, file)
+                    try:
+                        st = os.stat(full_path)
+                    except OSError:
+                        continue
+                    stamps[full_path] = (st.st_size, st.st_mtime_ns)
+                    rel_path = os.path.relpath(full_path, location)
+                    key = os.path.splitext(rel_path)[0].replace(os.sep, '/')
+                    lookup[key.lower()] = full_path
+        return txt_lookup, yaml_lookup, csv_lookup, stamps
+
+    def read_yaml(self, full_path):
+        try:
+            with open(full_path, encoding="utf8") as f:
+                return yaml.safe_load(f)
+        except Exception as e:
+            print(f"[UmiAI] Error parsing YAML {full_path}: {e}")
+            return None
+
+    def file_contribution(self, file_key, data):
+        """(index keys, tagged entries, tags) one YAML file adds to the catalog."""
+        keys, entries, tags = set(), {}, set()
+        if TagLoader.is_umi_format(data):
+            for k, v in data.items():
+                keys.add(k)
+                if isinstance(v, dict):
+                    processed = TagLoader.process_yaml_entry(k, v)
+                    if processed['tags']:
+                        entries[k.lower()] = processed
+                        tags.update(processed['tags'])
+        elif data is not None:
+            try:
+                for k in TagLoader.flatten_hierarchical_yaml(data).keys():
+                    keys.add(f"{file_key}/{k}")
+            except Exception:
+                pass
+        return keys, entries, tags
+
+    def refresh(self, roots=None, max_age=0.0):
+        """
+        Brings the catalog up to date; scans younger than max_age seconds are reused.
+        Callers that accept a stale view (max_age > 0) never wait for a rebuild another
+        thread already has under way and keep the current snapshot instead, except before
+        the first snapshot is published: then everyone waits for (or runs) that scan.
+        """
+        published = self.snapshot.version > 0
+        if published and max_age and self.last_scan and time.monotonic() - self.last_scan < max_age:
+            return self.snapshot.version
+        if not self.write_lock.acquire(blocking=not (published and max_age)):
+            return self.snapshot.version
+        try:
+            before = self.snapshot
+            version = self.update(roots, max_age)
+        finally:
+            self.write_lock.release()
+        if self.snapshot is not before:
+            for listener in list(self.listeners):
+                try:
+                    listener(self)
+                except Exception as e:
+                    print(f"[UmiAI] Catalog listener failed: {e}")
+        return version
+
+    def update(self, roots, max_age):
+        # Called with write_lock held
+        snap = self.snapshot
+        now = time.monotonic()
+        if snap.version and max_age and self.last_scan and now - self.last_scan < max_age:
+            return snap.version
+        self.last_scan = now
+
+        roots = tuple(get_all_wildcard_paths() if roots is None else roots)
+        txt_lookup, yaml_lookup, csv_lookup, stamps = self.scan(roots)
+        lookups = (txt_lookup, yaml_lookup, csv_lookup)
+        loras = tuple(folder_paths.get_filename_list("loras") or [])
+
+        if self.shared is not None:
+            try:
+                return self.update_shared(roots, stamps, lookups, loras)
+            except OSError as e:
+                print(f"[UmiAI] Shared catalog {self.shared.path} unavailable, keeping a private copy: {e}")
+                self.shared = None
+
+        changed = {p for p, stamp in stamps.items() if self.stamps.get(p) != stamp}
+        removed = set(self.stamps) - set(stamps)
+        structure_changed = (
+            roots != snap.roots or txt_lookup != snap.txt_lookup
+            or yaml_lookup != snap.yaml_lookup or csv_lookup != snap.csv_lookup
+        )
+        if not changed and not removed and not structure_changed:
+            if loras != snap.loras:
+                self.snapshot = snap.replace(loras=loras, version=snap.version + 1)
+            return self.snapshot.version
+
+        yaml_data, contributions, files_index, yaml_entries, entry_tags, umi_tags, merged_globals = self.compile(
+            roots, stamps, lookups, (self.stamps, self.yaml_data, self.contributions)
+        )
+        index_changed = (
+            files_index != snap.files_index or umi_tags != snap.umi_tags
+            or yaml_entries != snap.yaml_entries
+        )
+        self.stamps, self.yaml_data, self.contributions = stamps, yaml_data, contributions
+        # Built completely before it is published
+        self.snapshot = CatalogSnapshot(
+            snap.epoch,
+            version=snap.version + 1,
+            structure_version=snap.structure_version + (1 if structure_changed else 0),
+            index_version=snap.index_version + (1 if index_changed else 0),
+            roots=roots, stamps=stamps, yaml_data=yaml_data,
+            txt_lookup=txt_lookup, yaml_lookup=yaml_lookup, csv_lookup=csv_lookup,
+            files_index=files_index, yaml_entries=yaml_entries, entry_tags=entry_tags,
+            umi_tags=umi_tags, globals=merged_globals, loras=loras,
+        )
+
+        # New or removed files can change which file a name resolves to
+        invalidate_tag_cache(None if structure_changed else changed)
+        return self.snapshot.version
+
+    def compile(self, roots, stamps, lookups, previous):
+        """
+        Parses changed files and merges the index. `previous` is (stamps, yaml_data,
+        contributions) of the last build; files whose stamp is unchanged reuse its entries.
+        """
+        txt_lookup, yaml_lookup, csv_lookup = lookups
+        prev_stamps, prev_yaml, prev_contributions = previous
+
+        def unchanged(path):
+            # Stamps read back from a shared catalog file are lists, not tuples
+            prev = prev_stamps.get(path)
+            return prev is not None and tuple(prev) == stamps[path]
+
+        yaml_data = {}
+        for path in stamps:
+            if not path.lower().endswith('.yaml'):
+                continue
+            if unchanged(path) and path in prev_yaml:
+                yaml_data[path] = prev_yaml[path]
+            else:
+                yaml_data[path] = self.read_yaml(path)
+
+        contributions = {}
+        files_index = set(txt_lookup) | set(csv_lookup)
+        yaml_entries = {}
+        umi_tags = set()
+        for file_key, full_path in yaml_lookup.items():
+            if file_key == 'globals':
+                continue
+            cached = None
+            if unchanged(full_path):
+                cached = prev_contributions.get(full_path)
+            if cached is None or cached[0] != file_key:
+                cached = (file_key,) + self.file_contribution(file_key, parsed(yaml_data.get(full_path)))
+            contributions[full_path] = cached
+            files_index.update(cached[1])
+            yaml_entries.update(cached[2])
+            umi_tags.update(cached[3])
+
+        merged_globals = {}
+        for location in roots:
+            data = parsed(yaml_data.get(os.path.join(location, 'globals.yaml')))
+            if isinstance(data, dict):
+                merged_globals.update({str(k): str(v) for k, v in data.items()})
+        entry_tags = {title: entry['tags'] for title, entry in yaml_entries.items()}
+        return yaml_data, contributions, files_index, yaml_entries, entry_tags, umi_tags, merged_globals
+
+    def update_shared(self, roots, stamps, lookups, loras):
+        digest = stamps_digest(stamps)
+        mapped = self.shared.load()
+        if self.forced or mapped is None or not mapped.matches(roots, digest, loras):
+            # Other processes wait here for the one build, then map its result
+            with self.shared.writer():
+                mapped = self.shared.load()
+                if self.forced or mapped is None or not mapped.matches(roots, digest, loras):
+                    self.write_shared(mapped, roots, stamps, lookups, loras, digest)
+                    self.forced = False
+                    mapped = self.shared.load()
+        if mapped is None:
+            raise OSError("catalog file could not be mapped")
+        return self.adopt(mapped, stamps)
+
+    def write_shared(self, base, roots, stamps, lookups, loras, digest):
+        txt_lookup, yaml_lookup, csv_lookup = lookups
+        if base is not None and not self.forced:
+            # Unchanged files are copied from the previous file without unpickling their YAML
+            previous = (base.table('stamps'), RawTable(base.table('yaml_data')), base.table('contributions'))
+        else:
+            previous = ({}, {}, {})
+        yaml_data, contributions, files_index, yaml_entries, entry_tags, umi_tags, merged_globals = self.compile(
+            roots, stamps, lookups, previous
+        )
+
+        if base is not None:
+            header = base.header
+            epoch, version = header['epoch'], header['version']
+            structure_version, index_version = header['structure_version'], header['index_version']
+            structure_changed = (
+                base.roots != roots or txt_lookup != base.table('txt_lookup')
+                or yaml_lookup != base.table('yaml_lookup') or csv_lookup != base.table('csv_lookup')
+            )
+            index_changed = (
+                files_index != base.members('files_index') or umi_tags != base.members('umi_tags')
+                or yaml_entries != base.table('yaml_entries')
+            )
+        else:
+            snap = self.snapshot
+            epoch, version = snap.epoch, snap.version
+            structure_version, index_version = snap.structure_version, snap.index_version
+            structure_changed = index_changed = True
+
+        self.shared.write(
+            {
+                'epoch': epoch,
+                'version': version + 1,
+                'structure_version': structure_version + (1 if structure_changed else 0),
+                'index_version': index_version + (1 if index_changed else 0),
+                'roots': list(roots),
+                'loras': list(loras),
+                'globals': merged_globals,
+                'stamps_digest': digest,
+                'writer_pid': os.getpid(),
+            },
+            {
+                'stamps': (CODEC_JSON, stamps.items()),
+                'txt_lookup': (CODEC_STR, txt_lookup.items()),
+                'yaml_lookup': (CODEC_STR, yaml_lookup.items()),
+                'csv_lookup': (CODEC_STR, csv_lookup.items()),
+                'files_index': (CODEC_NONE, ((k, None) for k in files_index)),
+                'umi_tags': (CODEC_NONE, ((k, None) for k in umi_tags)),
+                'yaml_entries': (CODEC_JSON, yaml_entries.items()),
+                'entry_tags': (CODEC_JSON, entry_tags.items()),
+                'yaml_data': (CODEC_JSON, yaml_data.items()),
+                'contributions': (CODEC_JSON, contributions.items()),
+            },
+        )
+        print(f"[UmiAI] Wrote shared catalog {self.shared.path} (version {version + 1}, {len(stamps)} files).")
+
+    def adopt(self, mapped, stamps):
+        """Publishes a snapshot that reads straight from the mapped catalog file."""
+        snap = self.snapshot
+        if mapped is self.mapped:
+            return snap.version
+        header = mapped.header
+        changed = {p for p, stamp in stamps.items() if self.stamps.get(p) != stamp}
+        structure_changed = (
+            header['epoch'] != snap.epoch or header['structure_version'] != snap.structure_version
+        )
+        self.snapshot = CatalogSnapshot(
+            header['epoch'],
+            version=header['version'],
+            structure_version=header['structure_version'],
+            index_version=header['index_version'],
+            roots=mapped.roots, stamps=mapped.table('stamps'), yaml_data=mapped.table('yaml_data'),
+            txt_lookup=mapped.table('txt_lookup'), yaml_lookup=mapped.table('yaml_lookup'),
+            csv_lookup=mapped.table('csv_lookup'), files_index=mapped.members('files_index'),
+            yaml_entries=mapped.table('yaml_entries'), entry_tags=mapped.decoded_table('entry_tags'),
+            umi_tags=mapped.members('umi_tags'),
+            globals=header['globals'], loras=mapped.loras,
+        )
+        self.mapped = mapped
+        self.stamps, self.yaml_data, self.contributions = stamps, {}, {}
+        invalidate_tag_cache(None if structure_changed else changed)
+        return self.snapshot.version
+
+    def stats(self):
+        snap = self.snapshot
+        return {
+            "version": snap.etag(),
+            "files": len(snap.stamps),
+            "shared": self.shared.path if self.shared is not None else None,
+            "mapped": isinstance(snap.stamps, MappedTable),
+        }
+
+    def globals_paths(self):
+        return self.snapshot.globals_paths()
+
+    def fingerprint(self, paths, keys, titles, uses_index):
+        """
+        Cheap identity of one render's inputs: the file each key it looked up resolves to now
+        and the current YAML entry for each title it checked (None for a miss, so a name
+        that starts resolving counts as a change), the exact files it read (stat'ed now),
+        and the whole index only if it used globs or <[tags]>. Files added or removed
+        elsewhere in the library leave it unchanged.
+        """
+        snap = self.snapshot
+        h = hashlib.sha1()
+        h.update(f"{snap.epoch}".encode('utf-8'))
+        if uses_index:
+            h.update(f":{snap.index_version}".encode('utf-8'))
+        for key in sorted(keys):
+            h.update(f"\0{key}\0{snap.source_of(key)}".encode('utf-8', errors='replace'))
+        for title in sorted(titles, key=str):
+            entry = snap.entry_for(title)
+            h.update(f"\0{title}\0{entry!r}".encode('utf-8', errors='replace'))
+        # Globals apply to every render, so a globals.yaml appearing in any root counts too
+        for path in sorted(set(paths).union(snap.globals_paths())):
+            try:
+                st = os.stat(path)
+                stamp = f"{st.st_size}:{st.st_mtime_ns}"
+            except OSError:
+                stamp = "missing"
+            h.update(f"\0{path}\0{stamp}".encode('utf-8', errors='replace'))
+        return h.hexdigest()[:16]
+
+    def reset(self):
+        """
+        Forgets every stamp so the next refresh re-reads all files. The published snapshot
+        stays in place until that refresh replaces it.
+        """
+        with self.write_lock:
+            self.stamps = {}
+            self.contributions = {}
+            self.last_scan = 0.0
+            # A shared catalog is rewritten from scratch rather than copied forward
+            self.forced = True
+            invalidate_tag_cache()
+
+# Compiled catalog shared read-only by every ComfyUI process on this host (e.g. one per GPU).
+# "1" keeps it in cache/catalog.bin, any other value is the file to use; off by default.
+SHARED_CATALOG_SETTING = os.environ.get("UMIAI_SHARED_CATALOG", "0").strip()
+
+def shared_catalog_store():
+    if SHARED_CATALOG_SETTING in ("", "0"):
+        return None
+    if SHARED_CATALOG_SETTING == "1":
+        return SharedCatalogStore(os.path.join(os.path.dirname(__file__), "cache", "catalog.bin"))
+    return SharedCatalogStore(os.path.abspath(SHARED_CATALOG_SETTING))
+
+WILDCARD_CATALOG = WildcardCatalog(shared_catalog_store())
+
+CATALOG_WATCH_INTERVAL = float(os.environ.get("UMIAI_CATALOG_WATCH_INTERVAL", "5"))
+# Deltas larger than this tell clients to refetch instead of patching
+CATALOG_DELTA_MAX_ITEMS = 5000
+
+class CatalogBroadcaster:
+    """
+    Polls the catalog (wildcard roots and the loras folder) and pushes add/remove deltas to
+    every browser tab over the PromptServer websocket as "umi.catalog.delta". Clients apply
+    a delta only if its from_version matches what they hold, and refetch otherwise.
+    """
+    def __init__(self, catalog, interval):
+        self.catalog = catalog
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.published = None
+        self.thread = None
+        catalog.listeners.append(self.publish)
+
+    def publish(self, catalog=None):
+        # Keeps the published snapshot rather than a copy of its names; the sets below only
+        # live while a delta is computed, so a mapped catalog is not duplicated per process
+        snap = self.catalog.snapshot
+        with self.lock:
+            previous = self.published
+            self.published = snap
+        if previous is None or previous.etag() == snap.etag():
+            return
+
+        wildcards, loras = snap.files_index | snap.umi_tags, set(snap.loras)
+        old_wildcards, old_loras = previous.files_index | previous.umi_tags, set(previous.loras)
+        message = {"from_version": previous.etag(), "version": snap.etag()}
+        added_w, removed_w = sorted(wildcards - old_wildcards), sorted(old_wildcards - wildcards)
+        added_l, removed_l = sorted(loras - old_loras), sorted(old_loras - loras)
+        if len(added_w) + len(removed_w) + len(added_l) + len(removed_l) > CATALOG_DELTA_MAX_ITEMS:
+            message["resync"] = True
+        else:
+            message["wildcards"] = {"added": added_w, "removed": removed_w}
+            message["loras"] = {"added": added_l, "removed": removed_l}
+        try:
+            server.PromptServer.instance.send_sync("umi.catalog.delta", message)
+        except Exception as e:
+            print(f"[UmiAI] Could not send catalog delta: {e}")
+
+    def run(self):
+        self.catalog.refresh()
+        with self.lock:
+            if self.published is None:
+                self.published = self.catalog.snapshot
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.catalog.refresh(max_age=self.interval / 2)
+            except Exception as e:
+                print(f"[UmiAI] Catalog watch failed: {e}")
+
+    def start(self):
+        if self.interval <= 0 or (self.thread and self.thread.is_alive()):
+            return
+        self.thread = threading.Thread(target=self.run, name="UmiAI-Catalog-Watch", daemon=True)
+        self.thread.start()
+
+CATALOG_BROADCASTER = CatalogBroadcaster(WILDCARD_CATALOG, CATALOG_WATCH_INTERVAL)
+
+# ==============================================================================
+# RENDER OUTPUT CACHE
+# ==============================================================================
+# Expanded prompt + generated negative per (cleaned text, seed, size, stage flags, catalog
+# version). A new catalog version changes every key, so stale entries just age out.
+
+RENDER_CACHE = OrderedDict()
+RENDER_CACHE_LIMIT = int(os.environ.get("UMIAI_RENDER_CACHE", "512"))
+RENDER_CACHE_LOCK = threading.Lock()
+RENDER_CACHE_STATS = {'hits': 0, 'misses': 0}
+
+def render_cache_key(*parts):
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part).encode('utf-8', errors='replace'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def remember_render(key, result):
+    if RENDER_CACHE_LIMIT <= 0:
+        return
+    with RENDER_CACHE_LOCK:
+        RENDER_CACHE.pop(key, None)
+        RENDER_CACHE[key] = result
+        while len(RENDER_CACHE) > RENDER_CACHE_LIMIT:
+            RENDER_CACHE.popitem(last=False)
+
+def recall_render(key):
+    with RENDER_CACHE_LOCK:
+        result = RENDER_CACHE.get(key)
+        if result is None:
+            RENDER_CACHE_STATS['misses'] += 1
+        else:
+            RENDER_CACHE.move_to_end(key)
+            RENDER_CACHE_STATS['hits'] += 1
+        return result
+
+# (text, seed) -> {'deps': (paths, keys, entry titles, uses_index), 'fingerprint': at last render, 'tag': last IS_CHANGED value}
+# IS_CHANGED keeps returning the same tag while the recorded dependencies are untouched,
+# so ComfyUI reuses its cached outputs, and returns a new one as soon as any of them change.
+RENDER_DEPENDENCIES = OrderedDict()
+RENDER_DEPENDENCIES_LIMIT = 1024
+RENDER_DEPENDENCIES_LOCK = threading.Lock()
+
+def dependency_record(text, seed):
+    key = (text, seed)
+    record = RENDER_DEPENDENCIES.get(key)
+    if record is None:
+        record = RENDER_DEPENDENCIES[key] = {'deps': None, 'fingerprint': None, 'tag': f"{seed}_{text}"}
+        while len(RENDER_DEPENDENCIES) > RENDER_DEPENDENCIES_LIMIT:
+            RENDER_DEPENDENCIES.popitem(last=False)
+    RENDER_DEPENDENCIES.move_to_end(key)
+    return record
+
+def dependency_change_tag(text, seed):
+    with RENDER_DEPENDENCIES_LOCK:
+        record = dependency_record(text, seed)
+        deps, fingerprint = record['deps'], record['fingerprint']
+    if deps is None:
+        return record['tag']
+
+    WILDCARD_CATALOG.refresh(max_age=CATALOG_API_MAX_AGE)
+    current = WILDCARD_CATALOG.fingerprint(*deps)
+    if current != fingerprint:
+        with RENDER_DEPENDENCIES_LOCK:
+            record['tag'] = f"{seed}_{text}_{current}"
+    return record['tag']
+
+def record_dependencies(text, seed, deps):
+    fingerprint = WILDCARD_CATALOG.fingerprint(*deps)
+    with RENDER_DEPENDENCIES_LOCK:
+        record = dependency_record(text, seed)
+        record['deps'] = deps
+        record['fingerprint'] = fingerprint
+
+# ==============================================================================
+# WILDCARD USAGE ANALYTICS
+# ==============================================================================
+
+USAGE_PATH = os.path.join(os.path.dirname(__file__), "cache", "wildcard_usage.json")
+USAGE_SAMPLE_RATE = float(os.environ.get("UMIAI_USAGE_SAMPLE", "0.1"))
+USAGE_TOP_N = 1000
+USAGE_HALF_LIFE = 7 * 86400
+USAGE_FLUSH_INTERVAL = 60.0
+
+class WildcardUsage:
+    """
+    Sampled counters of which wildcard keys get resolved and which have to be materialized
+    (read from disk or the parsed catalog) and how long that takes. Each sampled event counts
+    1/sample_rate, so the figures estimate real totals. Flushed to disk as a rolling top-N
+    whose older counts decay with a one-week half-life, so the hot set follows the library's
+    current use; every process on the host merges into the same file. Warm-up preloads it
+    and the tag cache keeps it resident.
+    """
+    def __init__(self, path, sample_rate):
+        self.path = path
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.sampler = random.Random()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.history = None
+        self.history_time = time.time()
+        self.last_flush = time.monotonic()
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or (self.sample_rate > 0 and self.sampler.random() < self.sample_rate)
+
+    def bump(self, key, field, amount=1.0):
+        with self.lock:
+            counts = self.pending.get(key)
+            if counts is None:
+                counts = self.pending[key] = {'resolves': 0.0, 'loads': 0.0, 'load_ms': 0.0}
+            counts[field] += amount / self.sample_rate
+
+    def record_resolve(self, key):
+        if key and self.sampled():
+            self.bump(key.lower(), 'resolves')
+
+    def record_load(self, key, seconds):
+        if self.sampled():
+            key = key.lower()
+            self.bump(key, 'loads')
+            self.bump(key, 'load_ms', seconds * 1000.0)
+
+    def read_history(self):
+        """(keys, saved time) from the usage file on disk."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('keys', {}), data.get('saved', time.time())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[UmiAI] Could not read wildcard usage history: {e}")
+        return {}, time.time()
+
+    @staticmethod
+    def combine(history, history_time, pending):
+        """history decayed to now plus pending counts."""
+        decay = 0.5 ** (max(0.0, time.time() - history_time) / USAGE_HALF_LIFE)
+        merged = {k: {f: v * decay for f, v in counts.items()} for k, counts in history.items()}
+        for key, counts in pending.items():
+            target = merged.setdefault(key, {'resolves': 0.0, 'loads': 0.0, 'load_ms': 0.0})
+            for field, value in counts.items():
+                target[field] = target.get(field, 0.0) + value
+        return merged
+
+    def merged(self):
+        """History decayed to now plus unflushed counts. Caller holds the lock."""
+        if self.history is None:
+            self.history, self.history_time = self.read_history()
+        return self.combine(self.history, self.history_time, self.pending)
+
+    @staticmethod
+    def score(counts):
+        return counts.get('resolves', 0.0) + counts.get('loads', 0.0)
+
+    def top(self, limit=50):
+        with self.lock:
+            merged = self.merged()
+        ranked = sorted(merged.items(), key=lambda kv: self.score(kv[1]), reverse=True)[:limit]
+        return [
+            {
+                'key': key,
+                'resolves': round(counts.get('resolves', 0.0), 2),
+                'loads': round(counts.get('loads', 0.0), 2),
+                'avg_load_ms': round(counts['load_ms'] / counts['loads'], 3) if counts.get('loads') else None,
+            }
+            for key, counts in ranked
+        ]
+
+    def hot_keys(self, limit):
+        return [entry['key'] for entry in self.top(limit)]
+
+    def flush(self, force=False):
+        with self.lock:
+            if not self.pending or (not force and time.monotonic() - self.last_flush < USAGE_FLUSH_INTERVAL):
+                return
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        try:
+            # Other processes flush into the same file: re-read it under the host lock and
+            # add only our unflushed counts, so no process's counts are overwritten
+            with file_lock(self.path + ".lock"):
+                history, history_time = self.read_history()
+                merged = self.combine(history, history_time, pending)
+                ranked = dict(sorted(merged.items(), key=lambda kv: self.score(kv[1]), reverse=True)[:USAGE_TOP_N])
+                saved = time.time()
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'saved': saved, 'keys': ranked}, f)
+                os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"[UmiAI] Could not save wildcard usage history: {e}")
+            with self.lock:
+                for key, counts in pending.items():
+                    target = self.pending.setdefault(key, {'resolves': 0.0, 'loads': 0.0, 'load_ms': 0.0})
+                    for field, value in counts.items():
+                        target[field] += value
+            return
+        with self.lock:
+            self.history, self.history_time = ranked, saved
+
+WILDCARD_USAGE = WildcardUsage(USAGE_PATH, USAGE_SAMPLE_RATE)
+atexit.register(WILDCARD_USAGE.flush, True)
+
 class TagLoader:
     def __init__(self, wildcard_paths, options):
         if isinstance(wildcard_paths, str):
@@ -298,110 +1787,55 @@ class TagLoader:
 
         self.loaded_tags = {}
         self.yaml_entries = {}
+        self.entry_tags = {}
         self.files_index = set()
         self.umi_tags = set()
         self.index_built = False
         self.ignore_paths = options.get('ignore_paths', True)
         self.verbose = options.get('verbose', False)
+        self.catalog_max_age = options.get('catalog_max_age', 0.0)
         
         self.txt_lookup = {}
         self.yaml_lookup = {}
         self.csv_lookup = {}
+        self.globals = {}
+        self.snapshot = None
+        self.catalog_version = None
+        # Files this loader's render read, the keys and YAML entry titles it looked up (hits
+        # and misses), and whether it consulted the whole index
+        self.dependencies = set()
+        self.resolved_keys = set()
+        self.entry_titles = set()
+        self.uses_index = False
         
         self.refresh_maps()
 
     def refresh_maps(self):
-        self.txt_lookup = {}
-        self.yaml_lookup = {}
-        self.csv_lookup = {}
-        
-        for location in self.wildcard_locations:
-            if not os.path.exists(location):
-                continue
-                
-            for root, dirs, files in os.walk(location):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, location)
-                    key = os.path.splitext(rel_path)[0].replace(os.sep, '/')
-                    
-                    name_lower = file.lower()
-                    if name_lower.endswith('.txt'):
-                        self.txt_lookup[key.lower()] = full_path
-                    elif name_lower.endswith('.yaml'):
-                        self.yaml_lookup[key.lower()] = full_path
-                    elif name_lower.endswith('.csv'):
-                        self.csv_lookup[key.lower()] = full_path
+        WILDCARD_CATALOG.refresh(self.wildcard_locations, self.catalog_max_age)
+        # One snapshot for the whole run, even if the catalog is rebuilt meanwhile
+        snap = self.snapshot = WILDCARD_CATALOG.snapshot
+        self.txt_lookup = snap.txt_lookup
+        self.yaml_lookup = snap.yaml_lookup
+        self.csv_lookup = snap.csv_lookup
+        self.files_index = snap.files_index
+        self.yaml_entries = snap.yaml_entries
+        self.entry_tags = snap.entry_tags
+        self.umi_tags = snap.umi_tags
+        self.globals = snap.globals
+        self.catalog_version = snap.etag()
+        self.index_built = True
 
     def build_index(self):
-        if GLOBAL_INDEX['built']:
-            self.files_index = GLOBAL_INDEX['files']
-            self.yaml_entries = GLOBAL_INDEX['entries']
-            self.umi_tags = GLOBAL_INDEX.get('tags', set())
-            self.index_built = True
-            return
-
-        if self.index_built:
-            return
-
-        new_index = set()
-        new_entries = {}
-        new_tags = set()
-        
-        for key in self.txt_lookup.keys():
-            new_index.add(key)
-        for key in self.csv_lookup.keys():
-            new_index.add(key)
-
-        for file_key, full_path in self.yaml_lookup.items():
-            if file_key == 'globals':
-                continue
-            try:
-                with open(full_path, encoding="utf8") as f:
-                    data = yaml.safe_load(f)
-                    
-                    if self.is_umi_format(data):
-                         for k, v in data.items():
-                             new_index.add(k)
-                             if isinstance(v, dict):
-                                 processed = self.process_yaml_entry(k, v)
-                                 if processed['tags']:
-                                     new_entries[k.lower()] = processed
-                                     for t in processed['tags']:
-                                         new_tags.add(t)
-                    else:
-                        flat_data = self.flatten_hierarchical_yaml(data)
-                        for k in flat_data.keys():
-                            combined = f"{file_key}/{k}"
-                            new_index.add(combined)
-            except Exception as e:
-                pass
-
-        self.files_index = new_index
-        self.yaml_entries = new_entries
-        self.umi_tags = new_tags
-        self.index_built = True
-        
-        GLOBAL_INDEX['files'] = new_index
-        GLOBAL_INDEX['entries'] = new_entries
-        GLOBAL_INDEX['tags'] = new_tags
-        GLOBAL_INDEX['built'] = True
+        # The shared catalog builds the index while refreshing; kept for existing callers
+        if not self.index_built:
+            self.refresh_maps()
 
     def load_globals(self):
-        merged_globals = {}
-        for location in self.wildcard_locations:
-            global_path = os.path.join(location, 'globals.yaml')
-            if os.path.exists(global_path):
-                try:
-                    with open(global_path, 'r', encoding='utf-8') as f:
-                        data = yaml.safe_load(f)
-                        if isinstance(data, dict):
-                            merged_globals.update({str(k): str(v) for k, v in data.items()})
-                except Exception as e:
-                    print(f"[UmiAI] Error loading globals.yaml at {global_path}: {e}")
-        return merged_globals
+        self.dependencies.update(self.snapshot.globals_paths())
+        return dict(self.globals)
 
-    def process_yaml_entry(self, title, entry_data):
+    @staticmethod
+    def process_yaml_entry(title, entry_data):
         return {
             'title': title,
             'description': entry_data.get('Description', [None])[0] if isinstance(entry_data.get('Description', []), list) else None,
@@ -411,13 +1845,14 @@ class TagLoader:
             'tags': [x.lower().strip() for x in entry_data.get('Tags', [])]
         }
     
-    def flatten_hierarchical_yaml(self, data, prefix=""):
+    @staticmethod
+    def flatten_hierarchical_yaml(data, prefix=""):
         results = {}
         if isinstance(data, dict):
             for k, v in data.items():
                 clean_key = str(k).strip()
                 new_prefix = f"{prefix}/{clean_key}" if prefix else clean_key
-                results.update(self.flatten_hierarchical_yaml(v, new_prefix))
+                results.update(TagLoader.flatten_hierarchical_yaml(v, new_prefix))
         elif isinstance(data, list):
             clean_list = [str(x) for x in data if x is not None]
             results[prefix] = clean_list
@@ -425,7 +1860,8 @@ class TagLoader:
             results[prefix] = [str(data)]
         return results
 
-    def is_umi_format(self, data):
+    @staticmethod
+    def is_umi_format(data):
         if not isinstance(data, dict):
             return False
         for key, value in data.items():
@@ -436,26 +1872,45 @@ class TagLoader:
         return False
 
     def load_tags(self, requested_tag, verbose=False):
+        if requested_tag == ALL_KEY:
+            return self.read_tags(requested_tag, verbose)
+        self.resolved_keys.add(requested_tag.lower())
+
+        cached = GLOBAL_CACHE.get(requested_tag)
+        if cached is not None:
+            value, source = cached
+            if source:
+                self.dependencies.add(source)
+            return value
+
+        start = time.perf_counter()
+        result = self.read_tags(requested_tag, verbose)
+        if result:
+            WILDCARD_USAGE.record_load(requested_tag, time.perf_counter() - start)
+        return result
+
+    def read_tags(self, requested_tag, verbose=False):
         if requested_tag == ALL_KEY:
             self.build_index() 
-            return self.yaml_entries
+            self.uses_index = True
+            # title -> tags is all <[tag]> selection needs; full entries are looked up per pick
+            return self.entry_tags
 
-        if requested_tag in GLOBAL_CACHE:
-            return GLOBAL_CACHE[requested_tag]
-        
         lower_tag = requested_tag.lower()
         
         if lower_tag in self.txt_lookup:
+            self.dependencies.add(self.txt_lookup[lower_tag])
             with open(self.txt_lookup[lower_tag], encoding="utf8") as f:
                 lines = read_file_lines(f)
-                GLOBAL_CACHE[requested_tag] = lines
+                cache_tag_value(requested_tag, lines, self.txt_lookup[lower_tag], self.snapshot)
                 return lines
         
         if lower_tag in self.csv_lookup:
+            self.dependencies.add(self.csv_lookup[lower_tag])
             with open(self.csv_lookup[lower_tag], 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
                 rows = list(reader)
-                GLOBAL_CACHE[requested_tag] = rows
+                cache_tag_value(requested_tag, rows, self.csv_lookup[lower_tag], self.snapshot)
                 return rows
 
         parts = lower_tag.split('/')
@@ -474,52 +1929,46 @@ class TagLoader:
                     break
         
         if found_file:
-            with open(found_file, encoding="utf8") as file:
-                try:
-                    data = yaml.safe_load(file)
-                    
-                    if self.is_umi_format(data):
-                        for title, entry in data.items():
-                            if isinstance(entry, dict):
-                                processed = self.process_yaml_entry(title, entry)
-                                if processed['tags']:
-                                    self.yaml_entries[title.lower()] = processed
-
-                        if key_suffix:
-                             for k, v in data.items():
-                                 if k.lower() == key_suffix:
-                                     processed = self.process_yaml_entry(k, v)
-                                     GLOBAL_CACHE[requested_tag] = processed['prompts']
-                                     return processed['prompts']
-                        return []
+            self.dependencies.add(found_file)
+            # Parsed once per file version by the catalog
+            data = self.snapshot.yaml_data.get(found_file)
+            try:
+                if self.is_umi_format(data):
+                    if key_suffix:
+                         for k, v in data.items():
+                             if k.lower() == key_suffix:
+                                 processed = self.process_yaml_entry(k, v)
+                                 cache_tag_value(requested_tag, processed['prompts'], found_file, self.snapshot)
+                                 return processed['prompts']
+                    return []
 
+                else:
+                    flat_data = self.flatten_hierarchical_yaml(data)
+                    if key_suffix:
+                        for k, v in flat_data.items():
+                            if k.lower() == key_suffix:
+                                cache_tag_value(requested_tag, v, found_file, self.snapshot)
+                                return v
+                        return []
                     else:
-                        flat_data = self.flatten_hierarchical_yaml(data)
-                        if key_suffix:
-                            for k, v in flat_data.items():
-                                if k.lower() == key_suffix:
-                                    GLOBAL_CACHE[requested_tag] = v
-                                    return v
-                            return []
-                        else:
-                            all_values = []
-                            for v in flat_data.values():
-                                all_values.extend(v)
-                            return all_values
+                        all_values = []
+                        for v in flat_data.values():
+                            all_values.extend(v)
+                        return all_values
 
-                except Exception as e:
-                    if verbose: print(f'Error parsing YAML {found_file}: {e}')
+            except Exception as e:
+                if verbose: print(f'Error parsing YAML {found_file}: {e}')
 
         return []
 
     def get_glob_matches(self, pattern):
         self.build_index()
+        self.uses_index = True
         return fnmatch.filter(self.files_index, pattern)
 
     def get_entry_details(self, title):
-        if title and title.lower() in self.yaml_entries:
-            return self.yaml_entries[title.lower()]
-        return self.yaml_entries.get(title)
+        self.entry_titles.add(title)
+        return self.snapshot.entry_for(title)
 
 class TagSelector:
     def __init__(self, tag_loader, options):
@@ -629,7 +2078,7 @@ class TagSelector:
         return value
 
     def get_tag_group_choice(self, parsed_tag, groups, tags):
-        if not isinstance(tags, dict):
+        if not isinstance(tags, Mapping):
             return ""
 
         resolved_groups = []
@@ -681,6 +2130,17 @@ class TagSelector:
             return self.resolve_wildcard_recursively(selected_title, seed_id)
         return ""
 
+    def load_resolved(self, key):
+        """
+        load_tags for the key a tag resolves to. Only keys that loaded from the library are
+        counted in the usage stats, never the synthetic index key, <lora:...> tags or misses,
+        so the warm-up hot set only holds keys it can preload.
+        """
+        tags = self.tag_loader.load_tags(key, self.verbose)
+        if tags and key != ALL_KEY and not key.lower().startswith('lora:'):
+            WILDCARD_USAGE.record_resolve(key)
+        return tags
+
     def select(self, tag, groups=None):
         self.previously_selected_tags.setdefault(tag, 0)
         if self.previously_selected_tags.get(tag) > 500:
@@ -689,6 +2149,7 @@ class TagSelector:
         self.previously_selected_tags[tag] += 1
         parsed_tag = parse_tag(tag)
         
+        # Globs are recorded per matched key by the recursive select() calls
         if '*' in parsed_tag or '?' in parsed_tag:
             matches = self.tag_loader.get_glob_matches(parsed_tag)
             if matches:
@@ -707,16 +2168,16 @@ class TagSelector:
         if '$$' in parsed_tag and not parsed_tag.startswith('#'):
             range_part, file_part = parsed_tag.split('$$', 1)
             if any(c.isdigit() for c in range_part) or '-' in range_part:
-                tags = self.tag_loader.load_tags(file_part, self.verbose)
+                tags = self.load_resolved(file_part)
                 if isinstance(tags, list):
                     return process_wildcard_range(parsed_tag, tags, self.rng)
 
         if parsed_tag.startswith('#'):
-            tags = self.tag_loader.load_tags(parsed_tag.split('$$')[1], self.verbose)
+            tags = self.load_resolved(parsed_tag.split('$$')[1])
             if isinstance(tags, list):
                 return self.get_tag_choice(parsed_tag, tags)
 
-        tags = self.tag_loader.load_tags(parsed_tag, self.verbose)
+        tags = self.load_resolved(parsed_tag)
         
         if sequential and isinstance(tags, list) and tags:
             idx = self.global_seed % len(tags)
@@ -763,8 +2224,9 @@ class TagSelector:
 # VISION & LLM REPLACERS
 # ==============================================================================
 class VisionReplacer:
-    def __init__(self, node_instance, vision_model, refiner_model, vision_temp, refiner_temp, llm_tokens, image_input):
+    def __init__(self, node_instance, vision_model, refiner_model, vision_temp, refiner_temp, llm_tokens, image_input, llm_settings=None):
         self.node = node_instance
+        self.llm_settings = llm_settings
         self.vision_model = vision_model
         self.refiner_model = refiner_model
         self.vision_temp = vision_temp
@@ -796,7 +2258,8 @@ class VisionReplacer:
                 refiner_temperature=self.refiner_temp,
                 max_tokens=self.llm_tokens,
                 custom_prompt=custom_instruction,
-                image_input=self.image_input
+                image_input=self.image_input,
+                settings=self.llm_settings
             )
             
             if not result:
@@ -812,8 +2275,9 @@ class VisionReplacer:
         return prompt
 
 class LLMReplacer:
-    def __init__(self, node_instance, refiner_model, refiner_temp, llm_tokens, custom_prompt):
+    def __init__(self, node_instance, refiner_model, refiner_temp, llm_tokens, custom_prompt, llm_settings=None):
         self.node = node_instance
+        self.llm_settings = llm_settings
         self.refiner_model = refiner_model
         self.refiner_temp = refiner_temp
         self.llm_tokens = llm_tokens
@@ -842,7 +2306,8 @@ class LLMReplacer:
                 refiner_temperature=self.refiner_temp,
                 max_tokens=self.llm_tokens,
                 custom_prompt=self.custom_prompt,
-                image_input=None
+                image_input=None,
+                settings=self.llm_settings
             )
             
             if not result:
@@ -1108,71 +2573,149 @@ class VariableReplacer:
 # DANBOORU & LORA
 # ==============================================================================
 
-class DanbooruReplacer:
-    def __init__(self, options):
-        self.cache_dir = os.path.join(os.path.dirname(__file__), "cache")
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
-        
-        self.blacklist = {
-            "1girl", "1boy", "solo", "monochrome", "greyscale", "comic", 
-            "translated", "commentary_request", "highres", "absurdres", 
-            "looking_at_viewer", "smile", "open_mouth", "standing", "simple_background",
-            "white_background", "transparent_background"
-        }
-        self.pattern = re.compile(r"(?:<)?char:([^>,\n]+)(?:>)?")
-
-    def get_character_tags(self, character_name, threshold):
-        safe_name = re.sub(r'[^a-zA-Z0-9_]', '', character_name)
-        cache_path = os.path.join(self.cache_dir, f"{safe_name}.json")
-        
-        if os.path.exists(cache_path):
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-
-        url = "https://danbooru.donmai.us/posts.json"
+DANBOORU_POSTS_URL = "https://danbooru.donmai.us/posts.json"
+DANBOORU_NEGATIVE_TTL = 15 * 60
+DANBOORU_TIMEOUT = (3.05, 5)
+# Set on nodes without internet access: char: is then served only from the local store
+# (see `python danbooru_store.py import <dump>`), never from the API.
+DANBOORU_OFFLINE = os.environ.get("UMIAI_DANBOORU_OFFLINE", "").lower() in ("1", "true", "yes")
+
+class DanbooruClient:
+    """
+    Shared by every DanbooruReplacer: one pooled keep-alive session, at most one request
+    in flight per character, and failures/empty results remembered for
+    DANBOORU_NEGATIVE_TTL seconds so offline nodes stop paying the timeout on every run.
+    """
+    def __init__(self, max_workers=4):
+        self.session = None
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="UmiAI-Danbooru")
+        self.inflight = {}
+        self.negative = {}
+        self.lock = threading.Lock()
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+                session.mount("https://", adapter)
+                session.headers.update({"User-Agent": "ComfyUI-UmiAI/1.0"})
+                self.session = session
+            return self.session
+
+    def fetch_posts(self, character_name):
         params = {
             "tags": f"{character_name} solo", 
             "limit": 20,
             "only": "tag_string_character,tag_string_general"
         }
-        headers = {"User-Agent": "ComfyUI-UmiAI/1.0"}
-
         try:
-            response = requests.get(url, params=params, headers=headers, timeout=5)
+            response = self.get_session().get(DANBOORU_POSTS_URL, params=params, timeout=DANBOORU_TIMEOUT)
             if response.status_code != 200:
-                return []
-            posts = response.json()
+                return None
+            return response.json() or None
+        except Exception:
+            return None
+
+    def _fetch(self, character_name):
+        posts = self.fetch_posts(character_name)
+        with self.lock:
+            self.inflight.pop(character_name, None)
             if not posts:
-                return []
+                self.negative[character_name] = time.monotonic() + DANBOORU_NEGATIVE_TTL
+        return posts
 
-        except Exception:
-            return []
+    def lookup_many(self, names):
+        """Returns {name: posts or None}. Unknown names are fetched concurrently and callers
+        asking for a name that is already in flight wait on the same request."""
+        results = {}
+        futures = {}
+        now = time.monotonic()
+        with self.lock:
+            for name in names:
+                expiry = self.negative.get(name)
+                if expiry is not None:
+                    if expiry > now:
+                        results[name] = None
+                        continue
+                    del self.negative[name]
+                future = self.inflight.get(name)
+                if future is None:
+                    future = self.executor.submit(self._fetch, name)
+                    self.inflight[name] = future
+                futures[name] = future
+        for name, future in futures.items():
+            results[name] = future.result()
+        return results
+
+DANBOORU_CLIENT = DanbooruClient()
+DANBOORU_STORE = DanbooruTagStore(DANBOORU_DB_PATH)
+
+class DanbooruReplacer:
+    def __init__(self, options):
+        self.blacklist = CONSENSUS_TAG_BLACKLIST
+        self.pattern = re.compile(r"(?:<)?char:([^>,\n]+)(?:>)?")
 
+    def count_tags(self, posts):
         tag_counts = Counter()
-        total_posts = len(posts)
-        
         for post in posts:
             tags = post.get('tag_string_general', '').split() + post.get('tag_string_character', '').split()
-            tags = [t for t in tags if t != character_name]
             tag_counts.update(tags)
+        return tag_counts
+
+    def consensus_tags(self, character_name, record, threshold):
+        total_posts, tag_counts = record
+        if not total_posts:
+            return []
 
         consensus_tags = []
-        for tag, count in tag_counts.most_common():
+        character_name = character_name.lower()
+        for tag, count in tag_counts:
+            if tag == character_name:
+                continue
             frequency = count / total_posts
-            if frequency >= threshold and tag not in self.blacklist:
+            if frequency < threshold:
+                break
+            if tag not in self.blacklist:
                 clean_tag = tag.replace('_', ' ')
                 consensus_tags.append(clean_tag)
-
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(consensus_tags, f)
         return consensus_tags
 
+    def resolve_many(self, names, threshold):
+        records = {}
+        missing = []
+        for name in names:
+            record = DANBOORU_STORE.get(name)
+            if record is not None:
+                records[name] = record
+            else:
+                missing.append(name)
+
+        if missing and not DANBOORU_OFFLINE:
+            for name, posts in DANBOORU_CLIENT.lookup_many(missing).items():
+                if not posts:
+                    continue
+                tag_counts = self.count_tags(posts)
+                DANBOORU_STORE.put(name, len(posts), tag_counts)
+                records[name] = DANBOORU_STORE.get(name)
+
+        return {name: self.consensus_tags(name, records[name], threshold) if name in records else [] for name in names}
+
+    def get_character_tags(self, character_name, threshold):
+        return self.resolve_many([character_name], threshold)[character_name]
+
     def replace(self, text, threshold, max_tags):
+        # Resolve every char: in this pass up front so the lookups run concurrently
+        names = {match.group(1).strip().replace(" ", "_") for match in self.pattern.finditer(text)}
+        if not names:
+            return text
+        resolved = self.resolve_many(sorted(names), threshold)
+
         def _replace_match(match):
             raw_name = match.group(1).strip()
             api_name = raw_name.replace(" ", "_")
-            tags = self.get_character_tags(api_name, threshold)
+            tags = resolved.get(api_name)
             if not tags:
                 return raw_name 
             selected_tags = tags[:max_tags]
@@ -1181,14 +2724,451 @@ class DanbooruReplacer:
 
         return self.pattern.sub(_replace_match, text)
 
+LORA_INDEX_PATH = os.path.join(os.path.dirname(__file__), "cache", "lora_index.json")
+LORA_INDEX_TOP_TAGS = 64
+
+class LoRAMetadataIndex:
+    """
+    Persistent index of LoRA safetensors headers keyed by path and validated by size and
+    mtime. It keeps the most frequent training tags and basic network info, so the node
+    and the autocomplete endpoint never have to open weight files or re-parse
+    ss_tag_frequency on a run.
+    """
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self.entries = {}
+        self.loaded = False
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not os.path.exists(self.index_path):
+                return
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    self.entries = data.get('entries', {})
+            except Exception as e:
+                print(f"[UmiAI] Could not read LoRA index, rebuilding: {e}")
+                self.entries = {}
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            payload = {'version': 1, 'entries': self.entries}
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            print(f"[UmiAI] Could not save LoRA index: {e}")
+
+    def read_entry(self, lora_path, name, st):
+        entry = {
+            'name': name,
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'tags': None,
+            'base_model': None,
+            'network_dim': None,
+            'network_alpha': None,
+            'is_zimage': False,
+        }
+        try:
+            with safe_open(lora_path, framework="pt", device="cpu") as f:
+                metadata = f.metadata() or {}
+                entry['is_zimage'] = any(".attention.to_q." in k for k in f.keys())
+        except Exception:
+            return entry
+
+        entry['base_model'] = metadata.get("ss_base_model_version")
+        entry['network_dim'] = metadata.get("ss_network_dim")
+        entry['network_alpha'] = metadata.get("ss_network_alpha")
+        if "ss_tag_frequency" in metadata:
+            try:
+                freqs = json.loads(metadata["ss_tag_frequency"])
+                merged = Counter()
+                for dir_freq in freqs.values():
+                    merged.update(dir_freq)
+                entry['tags'] = [[t.strip(), c] for t, c in merged.most_common(LORA_INDEX_TOP_TAGS)]
+            except Exception:
+                pass
+        return entry
+
+    def get(self, lora_path, name=None):
+        self.load()
+        try:
+            st = os.stat(lora_path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(lora_path)
+            if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+                if name and entry['name'] != name:
+                    entry['name'] = name
+                    self.dirty = True
+                return entry
+        entry = self.read_entry(lora_path, name or (entry or {}).get('name') or os.path.basename(lora_path), st)
+        with self.lock:
+            self.entries[lora_path] = entry
+            self.dirty = True
+        return entry
+
+    def build(self):
+        """Indexes every file in the loras folders and drops entries for removed files."""
+        start = time.monotonic()
+        live = set()
+        for name in folder_paths.get_filename_list("loras"):
+            if not name.lower().endswith('.safetensors'):
+                continue
+            path = folder_paths.get_full_path("loras", name)
+            if path:
+                live.add(path)
+                self.get(path, name)
+        with self.lock:
+            for path in [p for p in self.entries if p not in live]:
+                del self.entries[path]
+                self.dirty = True
+        self.save()
+        print(f"[UmiAI] LoRA metadata index ready: {len(live)} files in {time.monotonic() - start:.2f}s")
+
+    def tag_summary(self, blacklist, max_tags=10):
+        """{lora name: top tags} for every indexed LoRA, without touching the files."""
+        self.load()
+        with self.lock:
+            entries = list(self.entries.values())
+        summary = {}
+        for entry in entries:
+            if entry.get('tags'):
+                summary[entry['name']] = filter_lora_tags(entry['tags'], blacklist, max_tags)
+        return summary
+
+LORA_METADATA_INDEX = LoRAMetadataIndex(LORA_INDEX_PATH)
+
+def filter_lora_tags(tag_counts, blacklist, max_tags):
+    filtered_tags = []
+    for t, c in tag_counts:
+        clean_t = t.strip()
+        if clean_t in blacklist:
+            continue
+        if " " in clean_t and clean_t.replace(" ", "_") in blacklist:
+            continue
+        filtered_tags.append(clean_t)
+        if len(filtered_tags) >= max_tags:
+            break
+    return filtered_tags
+
+LORA_TAG_BLACKLIST = {
+    "1girl", "1boy", "solo", "monochrome", "greyscale", "comic", "scenery",
+    "translated", "commentary_request", "highres", "absurdres", "masterpiece",
+    "best quality", "simple background", "white background", "transparent background"
+}
+
+class LoRANameIndex:
+    """
+    Case-insensitive <lora:name> resolution. Accepts the relative path or the bare file
+    name, with or without extension; relative paths win over bare names. Rebuilt only when
+    ComfyUI's lora file list changes, so a prompt's lookups are dict hits instead of stats.
+    """
+    def __init__(self):
+        self.names = None
+        self.paths = {}
+        self.basenames = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        names = folder_paths.get_filename_list("loras")
+        with self.lock:
+            if names == self.names:
+                return
+            paths = {}
+            basenames = {}
+            for name in names:
+                full_path = folder_paths.get_full_path("loras", name)
+                if not full_path:
+                    continue
+                rel = name.replace("\\", "/").lower()
+                base = rel.rsplit("/", 1)[-1]
+                for key in (rel, os.path.splitext(rel)[0]):
+                    paths.setdefault(key, full_path)
+                for key in (base, os.path.splitext(base)[0]):
+                    basenames.setdefault(key, full_path)
+            self.names = list(names)
+            self.paths = paths
+            self.basenames = basenames
+
+    def resolve(self, name):
+        self.refresh()
+        key = name.strip().replace("\\", "/").lower()
+        path = self.paths.get(key) or self.basenames.get(key)
+        if path:
+            return path
+        # Files with extensions ComfyUI does not list still resolve the old way
+        return folder_paths.get_full_path("loras", name) or folder_paths.get_full_path("loras", f"{name}.safetensors")
+
+LORA_NAME_INDEX = LoRANameIndex()
+
+LORA_CACHE_BUDGET_MB = int(os.environ.get("UMIAI_LORA_CACHE_MB", "2048"))
+# Lazy mode reads .safetensors LoRAs straight from a memory map while patching instead of
+# loading and caching a full state dict first
+LORA_LAZY_LOAD = os.environ.get("UMIAI_LORA_LAZY", "").lower() in ("1", "true", "yes")
+
+class LazyLoRAStateDict(Mapping):
+    """
+    Read-only state dict over a memory-mapped .safetensors file. Patching still copies
+    every tensor the model matches into its patch list, so the saving is on cache misses:
+    no intermediate full state dict and no LORA_MEMORY_CACHE entry, and workers reading
+    the same file share its page cache. Closed right after patching; the finalizer only
+    covers a dict that is dropped without close().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.handle = safe_open(path, framework="pt", device="cpu")
+        handle = self.handle.__enter__()
+        self.names = list(handle.keys())
+        self.name_set = set(self.names)
+        self.lock = threading.Lock()
+        self.finalizer = weakref.finalize(self, self.handle.__exit__, None, None, None)
+
+    def close(self):
+        """Releases the file handle and its mapping."""
+        with self.lock:
+            self.finalizer()
+
+    def __getitem__(self, key):
+        if key not in self.name_set:
+            raise KeyError(key)
+        with self.lock:
+            if not self.finalizer.alive:
+                raise KeyError(f"{key} ({self.path} is closed)")
+            return self.handle.get_tensor(key)
+
+    def __contains__(self, key):
+        return key in self.name_set
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+def state_dict_nbytes(state_dict):
+    total = 0
+    for v in state_dict.values():
+        if isinstance(v, torch.Tensor):
+            total += v.numel() * v.element_size()
+    return total
+
+class LoRAMemoryCache:
+    """
+    Process-wide LoRA state dict cache bounded by tensor bytes, so every node shares one
+    budget; a node's lora_cache_limit additionally caps how many unpinned LoRAs stay.
+    Pinned LoRAs are never evicted. pinned maps each key to its owners: None for process-wide
+    pins (UMIAI_LORA_PIN, POST /umiapp/lora_cache), a node's token for its lora_pin toggle.
+    """
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()
+        self.pinned = {}
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, stamp=None):
+        """stamp identifies the file version the entry was built from; a mismatch is a miss."""
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None or item[2] != stamp:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, state_dict, stamp=None, max_entries=None):
+        nbytes = state_dict_nbytes(state_dict)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            if nbytes > self.budget_bytes and key not in self.pinned:
+                return
+            self.entries[key] = (state_dict, nbytes, stamp)
+            self.used_bytes += nbytes
+            self.evict(max_entries)
+
+    def evict(self, max_entries=None):
+        unpinned = sum(1 for key in self.entries if key not in self.pinned)
+        for key in list(self.entries.keys()):
+            if self.used_bytes <= self.budget_bytes and (max_entries is None or unpinned <= max_entries):
+                break
+            if key in self.pinned:
+                continue
+            _, nbytes, _ = self.entries.pop(key)
+            self.used_bytes -= nbytes
+            self.evictions += 1
+            unpinned -= 1
+
+    def pin(self, key, owner=None):
+        with self.lock:
+            self.pinned.setdefault(key, set()).add(owner)
+
+    def unpin(self, key, owner=None):
+        with self.lock:
+            owners = self.pinned.get(key)
+            if owners is not None:
+                owners.discard(owner)
+                if not owners:
+                    del self.pinned[key]
+            self.evict()
+
+    def set_owner_pins(self, owner, keys):
+        """Makes keys exactly the set pinned by owner; other owners' pins are untouched."""
+        keys = set(keys)
+        with self.lock:
+            for key, owners in list(self.pinned.items()):
+                if owner in owners and key not in keys:
+                    owners.discard(owner)
+                    if not owners:
+                        del self.pinned[key]
+            for key in keys:
+                self.pinned.setdefault(key, set()).add(owner)
+            self.evict()
+
+    def set_budget(self, budget_bytes):
+        with self.lock:
+            self.budget_bytes = budget_bytes
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.used_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'used_mb': round(self.used_bytes / 2**20, 2),
+                'budget_mb': round(self.budget_bytes / 2**20, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'pinned': sorted(self.pinned),
+                'items': [
+                    {'path': k, 'mb': round(v[1] / 2**20, 2), 'pinned': k in self.pinned}
+                    for k, v in reversed(self.entries.items())
+                ],
+            }
+
+LORA_MEMORY_CACHE = LoRAMemoryCache(LORA_CACHE_BUDGET_MB * 2**20)
+
+# Comma separated LoRA names to keep resident, e.g. UMIAI_LORA_PIN="detail.safetensors,style/ink"
+for _pin_name in filter(None, (x.strip() for x in os.environ.get("UMIAI_LORA_PIN", "").split(","))):
+    _pin_path = LORA_NAME_INDEX.resolve(_pin_name)
+    if _pin_path:
+        LORA_MEMORY_CACHE.pin(_pin_path)
+
+# Patched clones share the base checkpoint's modules, so each entry can pin a whole
+# checkpoint; the default keeps only the latest combination
+PATCHED_MODEL_CACHE_LIMIT = int(os.environ.get("UMIAI_PATCHED_MODEL_CACHE", "1"))
+
+def null_ref():
+    return None
+
+def make_ref(obj):
+    """Weak reference to obj, or None when obj can't be referenced weakly (not cached)."""
+    if obj is None:
+        return null_ref
+    try:
+        return weakref.ref(obj)
+    except TypeError:
+        return None
+
+class PatchedModelCache:
+    """
+    Final (model, clip) pairs keyed by the identity of the incoming model/clip and the
+    ordered LoRA stack, so re-running the same <lora:...> combination skips patching.
+    Base objects are held weakly. Entries whose base model or clip is gone are dropped on
+    every get/put, so a replaced checkpoint is not kept alive by its patched clones, and an
+    id() reused by a new object never matches.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def alive(ref):
+        return ref is null_ref or ref() is not None
+
+    def purge(self):
+        """Drops entries whose base objects were freed. Caller holds the lock."""
+        for key in [k for k, e in self.entries.items() if not (self.alive(e[0]) and self.alive(e[1]))]:
+            del self.entries[key]
+
+    @staticmethod
+    def make_key(model, clip, stack):
+        parts = []
+        for lora_path, strength in stack:
+            try:
+                st = os.stat(lora_path)
+                parts.append((lora_path, st.st_size, st.st_mtime_ns, strength))
+            except OSError:
+                parts.append((lora_path, None, None, strength))
+        return (id(model), id(clip), tuple(parts))
+
+    def get(self, key, model, clip):
+        with self.lock:
+            self.purge()
+            entry = self.entries.get(key)
+            if entry is not None and (entry[0]() is not model or entry[1]() is not clip):
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2], entry[3]
+
+    def put(self, key, model, clip, patched_model, patched_clip):
+        model_ref, clip_ref = make_ref(model), make_ref(clip)
+        if self.limit <= 0 or model_ref is None or clip_ref is None:
+            return
+        with self.lock:
+            self.purge()
+            self.entries[key] = (model_ref, clip_ref, patched_model, patched_clip)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.limit:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            self.purge()
+            return {'entries': len(self.entries), 'limit': self.limit, 'hits': self.hits, 'misses': self.misses}
+
+PATCHED_MODEL_CACHE = PatchedModelCache(PATCHED_MODEL_CACHE_LIMIT)
+
+LORA_PREFETCH = ThreadPoolExecutor(max_workers=int(os.environ.get("UMIAI_LORA_PREFETCH_WORKERS", "4")), thread_name_prefix="UmiAI-LoRA")
+
 class LoRAHandler:
     def __init__(self):
         self.regex = re.compile(r'<lora:([^>]+)>', re.IGNORECASE)
-        self.blacklist = {
-            "1girl", "1boy", "solo", "monochrome", "greyscale", "comic", "scenery",
-            "translated", "commentary_request", "highres", "absurdres", "masterpiece",
-            "best quality", "simple background", "white background", "transparent background"
-        }
+        self.blacklist = LORA_TAG_BLACKLIST
 
     def patch_zimage_lora(self, lora):
         new_lora = {}
@@ -1241,61 +3221,91 @@ class LoRAHandler:
 
         return new_lora
 
-    def get_lora_tags(self, lora_path, max_tags=10):
-        try:
-            with safe_open(lora_path, framework="pt", device="cpu") as f:
-                metadata = f.metadata()
-            if not metadata:
-                return None
-            if "ss_tag_frequency" in metadata:
-                try:
-                    freqs = json.loads(metadata["ss_tag_frequency"])
-                    merged = Counter()
-                    for dir_freq in freqs.values():
-                        merged.update(dir_freq)
-                    filtered_tags = []
-                    for t, c in merged.most_common():
-                        clean_t = t.strip()
-                        if clean_t in self.blacklist:
-                            continue
-                        if " " in clean_t and clean_t.replace(" ", "_") in self.blacklist:
-                            continue
-                        filtered_tags.append(clean_t)
-                        if len(filtered_tags) >= max_tags:
-                            break
-                    return filtered_tags
-                except Exception:
-                    pass
-            return None
-        except Exception:
+    def get_lora_tags(self, lora_path, max_tags=10, name=None):
+        entry = LORA_METADATA_INDEX.get(lora_path, name)
+        if not entry or entry['tags'] is None:
             return None
+        return filter_lora_tags(entry['tags'], self.blacklist, max_tags)
+
+    def prepare_lora(self, lora_path):
+        lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
+        entry = LORA_METADATA_INDEX.get(lora_path)
+        is_zimage = entry['is_zimage'] if entry else any(".attention.to_q." in k for k in lora.keys())
+        if is_zimage:
+            lora = self.patch_zimage_lora(lora)
+        return lora
 
     def load_lora_cached(self, lora_path, limit):
-        if lora_path in LORA_MEMORY_CACHE:
-            data = LORA_MEMORY_CACHE.pop(lora_path)
-            LORA_MEMORY_CACHE[lora_path] = data
-            return data
-        
+        # Z-Image LoRAs still need their fused tensors built, so only plain .safetensors files go lazy
+        if LORA_LAZY_LOAD and lora_path.lower().endswith(".safetensors"):
+            entry = LORA_METADATA_INDEX.get(lora_path)
+            if entry is not None and not entry['is_zimage']:
+                return LazyLoRAStateDict(lora_path)
+
+        # Entries hold the ready-to-apply form (Z-Image LoRAs already QKV-fused), so the
+        # conversion runs once per file version instead of on every execution.
+        # limit == 0 opts this node out of caching; otherwise at most `limit` unpinned LoRAs
+        # stay cached, inside the global byte budget
         if limit == 0:
-            return comfy.utils.load_torch_file(lora_path, safe_load=True)
+            return self.prepare_lora(lora_path)
 
-        lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
-        
-        LORA_MEMORY_CACHE[lora_path] = lora
-        while len(LORA_MEMORY_CACHE) > limit:
-            LORA_MEMORY_CACHE.popitem(last=False)
-            
+        st = os.stat(lora_path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        lora = LORA_MEMORY_CACHE.get(lora_path, stamp)
+        if lora is not None:
+            return lora
+
+        lora = self.prepare_lora(lora_path)
+        LORA_MEMORY_CACHE.put(lora_path, lora, stamp, max_entries=limit)
         return lora
 
-    def extract_and_load(self, text, model, clip, behavior, cache_limit):
+    def apply_lora_stack(self, stack, model, clip, cache_limit):
+        """stack: [(name, lora_path, strength, info_lines)] applied in order."""
+        key = None
+        if cache_limit != 0:
+            key = PATCHED_MODEL_CACHE.make_key(model, clip, [(lora_path, strength) for _, lora_path, strength, _ in stack])
+            cached = PATCHED_MODEL_CACHE.get(key, model, clip)
+            if cached is not None:
+                return cached
+
+        # Read every file up front so disk I/O for later LoRAs overlaps patching the earlier ones
+        if len(stack) > 1:
+            pending = [LORA_PREFETCH.submit(self.load_lora_cached, lora_path, cache_limit) for _, lora_path, _, _ in stack]
+        else:
+            pending = [None]
+
+        base_model, base_clip = model, clip
+        complete = True
+        for (name, lora_path, strength, info_lines), future in zip(stack, pending):
+            lora = None
+            try:
+                lora = future.result() if future is not None else self.load_lora_cached(lora_path, cache_limit)
+                model, clip = comfy.sd.load_lora_for_models(model, clip, lora, strength, strength)
+            except Exception as e:
+                complete = False
+                print(f"[UmiAI] Failed to load LoRA {name}: {e}")
+                info_lines.append(f"Error loading: {e}")
+            finally:
+                # The patches now hold their own tensors; a lazy dict's mapping isn't needed
+                if isinstance(lora, LazyLoRAStateDict):
+                    lora.close()
+
+        if key is not None and complete:
+            PATCHED_MODEL_CACHE.put(key, base_model, base_clip, model, clip)
+        return model, clip
+
+    def parse_loras(self, text, behavior):
+        """
+        Strips <lora:...> tags and applies lora_tags_behavior without touching any weights.
+        Returns (clean_text, entries, info_blocks); entries are (name, lora_path or None,
+        strength, info_lines) in prompt order.
+        """
         matches = self.regex.findall(text)
         clean_text = self.regex.sub("", text)
         lora_info_output = []
         extracted_tags_str = ""
 
-        if model is None or clip is None:
-            return clean_text, model, clip, ""
-
+        entries = []
         for content in matches:
             content = content.strip()
             
@@ -1311,10 +3321,8 @@ class LoRAHandler:
                 name = content
                 strength = 1.0
 
-            lora_path = folder_paths.get_full_path("loras", name)
-            if not lora_path:
-                lora_path = folder_paths.get_full_path("loras", f"{name}.safetensors")
-            
+            lora_path = LORA_NAME_INDEX.resolve(name)
+
             if lora_path:
                 tags = self.get_lora_tags(lora_path)
                 info_block = f"[LORA: {name} (Str: {strength})]\n"
@@ -1322,33 +3330,43 @@ class LoRAHandler:
                     info_block += f"Common Tags: {', '.join(tags)}"
                 else:
                     info_block += "Common Tags: (No Metadata Found)"
-                lora_info_output.append(info_block)
+                lora_info_output.append([info_block])
+                entries.append((name, lora_path, strength, lora_info_output[-1]))
 
                 if behavior == "Append to Prompt" and tags:
                      extracted_tags_str += ", " + ", ".join(tags)
                 elif behavior == "Prepend to Prompt" and tags:
                      extracted_tags_str = ", ".join(tags) + ", " + extracted_tags_str
-
-                try:
-                    lora = self.load_lora_cached(lora_path, cache_limit)
-                    
-                    is_zimage = any(".attention.to_q." in k for k in lora.keys())
-                    if is_zimage:
-                        lora = self.patch_zimage_lora(lora)
-                    model, clip = comfy.sd.load_lora_for_models(model, clip, lora, strength, strength)
-                except Exception as e:
-                    print(f"[UmiAI] Failed to load LoRA {name}: {e}")
-                    lora_info_output.append(f"Error loading: {e}")
             else:
                  print(f"[UmiAI] LoRA not found: {name}")
-                 lora_info_output.append(f"[LORA: {name}] - NOT FOUND")
-        
+                 lora_info_output.append([f"[LORA: {name}] - NOT FOUND"])
+                 entries.append((name, None, strength, lora_info_output[-1]))
+
         if behavior == "Append to Prompt":
             clean_text = clean_text + extracted_tags_str
         elif behavior == "Prepend to Prompt":
             clean_text = extracted_tags_str + ", " + clean_text
 
-        return clean_text, model, clip, "\n\n".join(lora_info_output)
+        LORA_METADATA_INDEX.save()
+        return clean_text, entries, lora_info_output
+
+    @staticmethod
+    def format_info(info_blocks):
+        return "\n\n".join(line for block in info_blocks for line in block)
+
+    def extract_and_load(self, text, model, clip, behavior, cache_limit, pin_owner=None, pin=False):
+        """pin_owner identifies the calling node; with pin=True the LoRAs applied here are
+        pinned in LORA_MEMORY_CACHE for it, replacing what it pinned on its previous run."""
+        if model is None or clip is None:
+            return self.regex.sub("", text), model, clip, ""
+
+        clean_text, entries, info_blocks = self.parse_loras(text, behavior)
+        stack = [entry for entry in entries if entry[1]]
+        if pin_owner is not None:
+            LORA_MEMORY_CACHE.set_owner_pins(pin_owner, [lora_path for _, lora_path, _, _ in stack] if pin else ())
+        if stack:
+            model, clip = self.apply_lora_stack(stack, model, clip, cache_limit)
+        return clean_text, model, clip, self.format_info(info_blocks)
 
 class NegativePromptGenerator:
     def __init__(self):
@@ -1375,17 +3393,15 @@ class NegativePromptGenerator:
 class UmiAIWildcardNode:
     def __init__(self):
         self.loaded = False
+        # Owner token for the LoRAs this node pins with lora_pin
+        self.pin_owner = f"node:{id(self)}"
         self.llm_path = os.path.join(folder_paths.models_dir, "llm")
         if not os.path.exists(self.llm_path):
             os.makedirs(self.llm_path, exist_ok=True)
 
     @classmethod
     def INPUT_TYPES(s):
-        llm_files = folder_paths.get_filename_list("llm") if "llm" in folder_paths.folder_names_and_paths else []
-        if not llm_files:
-             llm_path = os.path.join(folder_paths.models_dir, "llm")
-             if os.path.exists(llm_path):
-                 llm_files = [f for f in os.listdir(llm_path) if f.endswith('.gguf')]
+        llm_files = GGUF_REGISTRY.model_names()
         
         download_options = list(DOWNLOADABLE_MODELS.keys())
         llm_options = ["None"] + download_options + llm_files
@@ -1403,7 +3419,11 @@ class UmiAIWildcardNode:
 
                 # Basic Settings
                 "lora_tags_behavior": (["Append to Prompt", "Disabled", "Prepend to Prompt"], {"default": "Append to Prompt"}),
-                "lora_cache_limit": ("INT", {"default": 5, "min": 0, "max": 50, "step": 1}),
+                "lora_cache_limit": ("INT", {
+                    "default": 5, "min": 0, "max": 50, "step": 1,
+                    "tooltip": "How many LoRAs to keep loaded between runs; 0 disables caching for this node. The cache "
+                               f"is also bounded by one budget shared by all nodes, UMIAI_LORA_CACHE_MB ({LORA_CACHE_BUDGET_MB} MB).",
+                }),
                 "width": ("INT", {"default": 1024, "min": 64, "max": 8192}),
                 "height": ("INT", {"default": 1024, "min": 64, "max": 8192}),
                 
@@ -1425,18 +3445,33 @@ class UmiAIWildcardNode:
                 # Danbooru Settings
                 "danbooru_threshold": ("FLOAT", {"default": 0.70, "min": 0.1, "max": 1.0, "step": 0.05}),
                 "danbooru_max_tags": ("INT", {"default": 15, "min": 1, "max": 50}),
+
+                # Widgets are restored by position in saved workflows, so new ones go last
+                "llm_profile": (LLM_PROFILES, {"default": "Auto"}),
+                "llm_backend": (LLM_BACKENDS, {"default": LLM_BACKEND_LOCAL}),
+                "llm_endpoint": ("STRING", {"default": DEFAULT_LLM_ENDPOINT}),
+                "llm_latency_budget": ("FLOAT", {
+                    "default": 0.0, "min": 0.0, "max": 600.0, "step": 0.5,
+                    "tooltip": "Seconds LLM/Vision tags may take per run; 0 disables. Checked before each generation "
+                               "and between tokens, so prompt evaluation before the first token can overshoot it.",
+                }),
+                "lora_pin": ("BOOLEAN", {
+                    "default": False, "label_on": "Pin LoRAs", "label_off": "Pin Disabled",
+                    "tooltip": "Keep the LoRAs this node applies cached and exempt from eviction until turned off. "
+                               "UMIAI_LORA_PIN and POST /umiapp/lora_cache pin for every node in this ComfyUI process.",
+                }),
             }
         }
 
-    RETURN_TYPES = ("MODEL", "CLIP", "STRING", "STRING", "INT", "INT", "STRING")
-    RETURN_NAMES = ("model", "clip", "text", "negative_text", "width", "height", "lora_info")
+    RETURN_TYPES = ("MODEL", "CLIP", "STRING", "STRING", "INT", "INT", "STRING", "STRING")
+    RETURN_NAMES = ("model", "clip", "text", "negative_text", "width", "height", "lora_info", "llm_info")
     FUNCTION = "process"
     CATEGORY = "UmiAI"
     COLOR = "#322947"
     
     @classmethod
     def IS_CHANGED(cls, text, seed, **kwargs):
-        return f"{seed}_{text}"
+        return dependency_change_tag(text, seed)
 
     def extract_settings(self, text):
         settings_regex = re.compile(r'@@(.*?)@@')
@@ -1499,67 +3534,95 @@ class UmiAIWildcardNode:
             
             return local_file_path, mmproj_path
         
-        # 2. Local File Mode (Auto-Detect Adapter)
+        # 2. Local File Mode (Adapter paired from GGUF headers)
         else:
-            # Check for exact path
-            path = folder_paths.get_full_path("llm", model_choice)
-            if not path:
-                # Fallback: check simply inside models/llm/
-                potential = os.path.join(target_folder, model_choice)
-                if os.path.exists(potential):
-                    path = potential
-            
+            path = GGUF_REGISTRY.resolve(model_choice)
             if not path:
                 return None, None
-            
-            # --- AGGRESSIVE ADAPTER SEARCH ---
-            mmproj_path = None
-            
-            # Strategy A: Check exact name pairs
-            base = os.path.splitext(path)[0]
-            candidates = [
-                base + "-mmproj.gguf", 
-                base + ".mmproj.gguf", 
-                base + "-vision.gguf",
-                base.replace("Q4_K_M", "mmproj-f16"),
-                base.replace("Q6_K", "mmproj-f16"),
-                base.replace("Q4_K", "mmproj-Q4_0"), # Common for Llava
+            return path, GGUF_REGISTRY.find_projector(path)
+
+    def run_server_naturalizer(self, text, model_choice, refiner_choice, vision_temperature, refiner_temperature, max_tokens, custom_prompt, image_input=None, settings=None):
+        """Same two stages as the in-process path, served by the configured llm_endpoint."""
+        settings = settings or LLMRunSettings()
+        def server_model_name(choice):
+            return DOWNLOADABLE_MODELS.get(choice, {}).get("filename", choice)
+
+        def server_chat(stage, model, messages, temperature, cache_key, raw):
+            start = time.monotonic()
+            if settings.deadline is None:
+                result = LLM_HTTP_CLIENT.chat(settings.endpoint, model, messages, temperature, max_tokens)
+            else:
+                if settings.budget_exhausted():
+                    return settings.fallback(stage, cache_key, raw, "no latency budget left")
+                try:
+                    result, truncated = LLM_HTTP_CLIENT.chat_stream(settings.endpoint, model, messages, temperature, max_tokens, settings.deadline)
+                except requests.Timeout:
+                    return settings.fallback(stage, cache_key, raw, "server did not answer within the latency budget")
+                if truncated:
+                    if not result:
+                        return settings.fallback(stage, cache_key, raw, "latency budget ran out before any output")
+                    settings.note(f"{stage}: latency budget ran out, output truncated")
+                    return result
+            remember_llm_result(cache_key, result)
+            settings.note(f"{stage}: ok ({time.monotonic() - start:.2f}s)")
+            return result
+
+        raw_vision_output = ""
+
+        if is_valid_image(image_input) and model_choice != "None":
+            vision_instruction = "Describe this image in extreme detail."
+            image_url = image_to_data_url(image_input)
+            cache_key = llm_result_key("vision", model_choice, vision_instruction, image_url)
+            try:
+                messages = build_vision_messages(image_url, vision_instruction)
+                raw_vision_output = server_chat("vision", server_model_name(model_choice), messages, vision_temperature, cache_key, "")
+            except Exception as e:
+                print(f"[UmiAI] LLM Server Vision Error: {e}")
+                return f"[Error: {str(e)}]"
+
+        if refiner_choice != "None":
+            if not raw_vision_output and not text:
+                 return "[VISION_ERROR: Vision Model failed to generate text. Check console for details.]"
+            if not raw_vision_output:
+                 raw_vision_output = text
+
+            instruction = custom_prompt if custom_prompt else "You are an AI image prompt assistant. Rewrite the following into detailed natural language."
+            messages = [
+                {"role": "system", "content": instruction},
+                {"role": "user", "content": raw_vision_output}
             ]
-            for c in candidates:
-                if os.path.exists(c):
-                    mmproj_path = c
-                    break
-            
-            # Strategy B: Scan folder for ANY 'mmproj' file
-            # If not found, scan directory for matching mmproj
-            if not mmproj_path:
-                folder = os.path.dirname(path)
-                # Filter for JoyCaption specific or generic
-                is_joy = "joycaption" in model_choice.lower()
-                is_llava = "llava" in model_choice.lower()
-                
-                for f in os.listdir(folder):
-                    if "mmproj" in f.lower() and f.endswith(".gguf"):
-                        if is_joy and "joycaption" in f.lower():
-                            mmproj_path = os.path.join(folder, f)
-                            break
-                        if is_llava and "llava" in f.lower():
-                             mmproj_path = os.path.join(folder, f)
-                             break
+            cache_key = llm_result_key("refiner", refiner_choice, instruction, raw_vision_output)
+            try:
+                return server_chat("refiner", server_model_name(refiner_choice), messages, refiner_temperature, cache_key, raw_vision_output)
+            except Exception as e:
+                print(f"[UmiAI] LLM Server Refiner Error: {e}")
+                return raw_vision_output # Fallback
+
+        return raw_vision_output
 
-            return path, mmproj_path
+    def run_llm_naturalizer(self, text, model_choice, refiner_choice, vision_temperature, refiner_temperature, max_tokens, custom_prompt, image_input=None, settings=None):
+        settings = settings or LLMRunSettings()
+        if settings.backend == LLM_BACKEND_SERVER:
+            return self.run_server_naturalizer(text, model_choice, refiner_choice, vision_temperature, refiner_temperature, max_tokens, custom_prompt, image_input, settings)
 
-    def run_llm_naturalizer(self, text, model_choice, refiner_choice, vision_temperature, refiner_temperature, max_tokens, custom_prompt, image_input=None):
         if not LLAMA_CPP_AVAILABLE:
             return "[Error: llama_cpp_python not installed]"
         
+        profile = resolve_llm_profile(settings.profile)
+        gpu_layers = llm_gpu_layers(profile)
+        deadline = settings.deadline
+        # CPU instances share the page cache and are always kept warm; GPU ones hold VRAM
+        # next to the diffusion model, so they are only kept when explicitly allowed
+        pooled = profile == "CPU" or LLM_KEEP_GPU_RESIDENT
+
         # --- STAGE 1: VISION (Only if Image Input is present) ---
         raw_vision_output = ""
         
         if is_valid_image(image_input) and model_choice != "None":
             # GC
-            gc.collect()
-            torch.cuda.empty_cache()
+            if not pooled:
+                gc.collect()
+                torch.cuda.empty_cache()
 
             model_path, mmproj_path = self.ensure_model_exists(model_choice)
             if not model_path:
@@ -1571,55 +3634,66 @@ class UmiAIWildcardNode:
 
             print(f"[UmiAI] Vision Adapter Loaded: {mmproj_path}")
 
-            llm = None
-            try:
+            vision_instruction = "Describe this image in extreme detail."
+            image_tokens = GGUF_REGISTRY.image_tokens(mmproj_path)
+            n_ctx = GGUF_REGISTRY.context_size(model_path, estimate_context_size(vision_instruction, max_tokens, image_tokens))
+            image_url = image_to_data_url(image_input)
+            cache_key = llm_result_key("vision", model_path, vision_instruction, image_url)
+
+            def load_vision_model():
+                llama_kwargs = build_llama_kwargs(profile, n_ctx)
                 chat_handler = None
                 if mmproj_path:
-                    # USE CUSTOM HANDLER FOR JOYCAPTION (LLAMA 3)
-                    if "joycaption" in str(model_choice).lower():
-                        chat_handler = JoyCaptionChatHandler(clip_model_path=mmproj_path)
+                    # USE CUSTOM HANDLER FOR LLAMA 3 TEMPLATED MODELS (JOYCAPTION)
+                    if GGUF_REGISTRY.prompt_format(model_path, model_choice) == "llama3":
+                        chat_handler = JoyCaptionChatHandler(clip_model_path=mmproj_path, verbose=llama_kwargs['verbose'])
                     else:
-                        chat_handler = Llava15ChatHandler(clip_model_path=mmproj_path)
+                        chat_handler = Llava15ChatHandler(clip_model_path=mmproj_path, verbose=llama_kwargs['verbose'])
                 
                 # Initialize Llama 
-                llm = Llama(
-                    model_path=model_path, 
-                    chat_handler=chat_handler,
-                    n_ctx=4096, 
-                    n_gpu_layers=-1, 
-                    verbose=True 
-                )
-                
-                messages = []
-                user_content = []
-                
-                # Convert Tensor (Batch, H, W, C) -> PIL -> Base64
-                i = 255. * image_input[0].cpu().numpy()
-                img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-                
-                buffered = io.BytesIO()
-                img.save(buffered, format="JPEG")
-                img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-                
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_str}"}
-                })
-                
-                # GENERIC PROMPT FOR VISION (Just get the data)
-                user_content.append({"type": "text", "text": "Describe this image in extreme detail."})
-                messages.append({"role": "user", "content": user_content})
-
-                output = llm.create_chat_completion(
-                    messages=messages,
-                    temperature=vision_temperature, 
-                    max_tokens=max_tokens
-                )
-                
-                raw_vision_output = output['choices'][0]['message']['content'].strip()
-                
-                if len(raw_vision_output) > 20 and raw_vision_output[:10] == "1: 1: 1: 1":
-                    return "[VISION_ERROR: Projector Mismatch. Please use Auto-Update to install compatible llama-cpp-python.]"
+                return Llama(model_path=model_path, chat_handler=chat_handler, **llama_kwargs)
+
+            llm = None
+            start = time.monotonic()
+            try:
+                if deadline is not None:
+                    llm = checkout_llm_within(model_path, mmproj_path, n_ctx, gpu_layers, load_vision_model, deadline, keep=pooled) if not settings.budget_exhausted() else None
+                elif pooled:
+                    llm = LLM_POOL.checkout(model_path, mmproj_path, n_ctx, gpu_layers)
+                if llm is None and deadline is None:
+                    llm = load_vision_model()
+
+                if llm is None:
+                    raw_vision_output = settings.fallback("vision", cache_key, "", "model not ready within the latency budget")
+                elif settings.budget_exhausted():
+                    raw_vision_output = settings.fallback("vision", cache_key, "", "no latency budget left to generate")
+                else:
+                    messages = build_vision_messages(image_url, vision_instruction)
+
+                    truncated = False
+                    if deadline is None:
+                        output = llm.create_chat_completion(
+                            messages=messages,
+                            temperature=vision_temperature, 
+                            max_tokens=max_tokens
+                        )
+                        raw_vision_output = output['choices'][0]['message']['content'].strip()
+                    else:
+                        raw_vision_output, truncated = collect_stream(
+                            llm.create_chat_completion(messages=messages, temperature=vision_temperature, max_tokens=max_tokens, stream=True),
+                            deadline, is_chat=True
+                        )
+                    
+                    if len(raw_vision_output) > 20 and raw_vision_output[:10] == "1: 1: 1: 1":
+                        return "[VISION_ERROR: Projector Mismatch. Please use Auto-Update to install compatible llama-cpp-python.]"
+
+                    if not truncated:
+                        remember_llm_result(cache_key, raw_vision_output)
+                        settings.note(f"vision: ok ({time.monotonic() - start:.2f}s)")
+                    elif raw_vision_output:
+                        settings.note("vision: latency budget ran out, output truncated")
+                    else:
+                        raw_vision_output = settings.fallback("vision", cache_key, "", "latency budget ran out before any output")
                     
             except Exception as e:
                 print(f"[UmiAI] LLM/Vision Error: {e}")
@@ -1627,9 +3701,13 @@ class UmiAIWildcardNode:
             
             finally:
                 if llm:
+                    if pooled:
+                        LLM_POOL.checkin(model_path, mmproj_path, gpu_layers, llm)
                     del llm
-                gc.collect()
-                torch.cuda.empty_cache()
+                if not pooled:
+                    LLM_POOL.evict_gpu()
+                    gc.collect()
+                    torch.cuda.empty_cache()
 
         # --- STAGE 2: REFINEMENT (Only if Refiner Model is selected) ---
         if refiner_choice != "None":
@@ -1642,8 +3720,9 @@ class UmiAIWildcardNode:
                  raw_vision_output = text
 
             # GC Again before loading second model
-            gc.collect()
-            torch.cuda.empty_cache()
+            if not pooled:
+                gc.collect()
+                torch.cuda.empty_cache()
             
             refiner_path, _ = self.ensure_model_exists(refiner_choice)
             if not refiner_path:
@@ -1651,28 +3730,40 @@ class UmiAIWildcardNode:
 
             print(f"[UmiAI] Loading Refiner: {refiner_path}")
             
+            instruction = custom_prompt if custom_prompt else "You are an AI image prompt assistant. Rewrite the following into detailed natural language."
+            n_ctx = GGUF_REGISTRY.context_size(refiner_path, estimate_context_size(instruction + raw_vision_output, max_tokens))
+            cache_key = llm_result_key("refiner", refiner_path, instruction, raw_vision_output)
+
+            def load_refiner_model():
+                # Initialize Text-Only Model
+                return Llama(model_path=refiner_path, **build_llama_kwargs(profile, n_ctx))
+
             refiner_llm = None
+            start = time.monotonic()
             try:
-                # Initialize Text-Only Model
-                refiner_llm = Llama(
-                    model_path=refiner_path, 
-                    n_ctx=4096, 
-                    n_gpu_layers=-1, 
-                    verbose=True 
-                )
-                
-                instruction = custom_prompt if custom_prompt else "You are an AI image prompt assistant. Rewrite the following into detailed natural language."
+                if deadline is not None:
+                    refiner_llm = checkout_llm_within(refiner_path, None, n_ctx, gpu_layers, load_refiner_model, deadline, keep=pooled) if not settings.budget_exhausted() else None
+                    if refiner_llm is None:
+                        return settings.fallback("refiner", cache_key, raw_vision_output, "model not ready within the latency budget")
+                    if settings.budget_exhausted():
+                        return settings.fallback("refiner", cache_key, raw_vision_output, "no latency budget left to generate")
+                else:
+                    refiner_llm = LLM_POOL.checkout(refiner_path, None, n_ctx, gpu_layers) if pooled else None
+                    if refiner_llm is None:
+                        refiner_llm = load_refiner_model()
                 
                 # =========================================================================
-                # 3. MANUAL PROMPT CONSTRUCTION FOR DOLPHIN/LLAMA 3 (NUCLEAR OPTION)
-                #    We detect if it's Dolphin/Llama and use raw completion instead of chat.
+                # 3. MANUAL PROMPT CONSTRUCTION FOR LLAMA 3 (NUCLEAR OPTION)
+                #    The chat template embedded in the GGUF header tells us whether this
+                #    is a Llama-3 model; those get raw completion instead of chat.
                 #    This is the only 100% reliable way to stop the "Parroting" loop.
                 # =========================================================================
                 
-                is_dolphin_or_llama = "dolphin" in refiner_choice.lower() or "llama" in refiner_choice.lower() or "imp" in refiner_choice.lower()
+                prompt_format = GGUF_REGISTRY.prompt_format(refiner_path, refiner_choice)
+                truncated = False
                 
-                if is_dolphin_or_llama:
-                    print("[UmiAI] Detected Dolphin/Llama-3 model. Using Manual Prompt Construction.")
+                if prompt_format == "llama3":
+                    print("[UmiAI] Detected Llama-3 chat template. Using Manual Prompt Construction.")
                     
                     # Manually constructed Llama-3 prompt string
                     prompt_string = (
@@ -1684,13 +3775,17 @@ class UmiAIWildcardNode:
                     )
                     
                     # Use create_completion (Raw) instead of chat completion
-                    output = refiner_llm.create_completion(
+                    completion_args = dict(
                         prompt=prompt_string,
                         temperature=refiner_temperature,
                         max_tokens=max_tokens,
                         stop=["<|eot_id|>", "<|end_of_text|>", "</s>"]
                     )
-                    return output['choices'][0]['text'].strip()
+                    if deadline is None:
+                        output = refiner_llm.create_completion(**completion_args)
+                        result = output['choices'][0]['text'].strip()
+                    else:
+                        result, truncated = collect_stream(refiner_llm.create_completion(stream=True, **completion_args), deadline, is_chat=False)
 
                 else:
                     # FALLBACK FOR QWEN / OTHER MODELS (Chat Completion works fine usually)
@@ -1699,12 +3794,27 @@ class UmiAIWildcardNode:
                         {"role": "user", "content": raw_vision_output}
                     ]
                     
-                    output = refiner_llm.create_chat_completion(
-                        messages=messages,
-                        temperature=refiner_temperature,
-                        max_tokens=max_tokens
-                    )
-                    return output['choices'][0]['message']['content'].strip()
+                    if deadline is None:
+                        output = refiner_llm.create_chat_completion(
+                            messages=messages,
+                            temperature=refiner_temperature,
+                            max_tokens=max_tokens
+                        )
+                        result = output['choices'][0]['message']['content'].strip()
+                    else:
+                        result, truncated = collect_stream(
+                            refiner_llm.create_chat_completion(messages=messages, temperature=refiner_temperature, max_tokens=max_tokens, stream=True),
+                            deadline, is_chat=True
+                        )
+
+                if not truncated:
+                    remember_llm_result(cache_key, result)
+                    settings.note(f"refiner: ok ({time.monotonic() - start:.2f}s)")
+                elif result:
+                    settings.note("refiner: latency budget ran out, output truncated")
+                else:
+                    return settings.fallback("refiner", cache_key, raw_vision_output, "latency budget ran out before any output")
+                return result
 
             except Exception as e:
                 print(f"[UmiAI] Refiner Error: {e}")
@@ -1712,9 +3822,13 @@ class UmiAIWildcardNode:
             
             finally:
                 if refiner_llm:
+                    if pooled:
+                        LLM_POOL.checkin(refiner_path, None, gpu_layers, refiner_llm)
                     del refiner_llm
-                gc.collect()
-                torch.cuda.empty_cache()
+                if not pooled:
+                    LLM_POOL.evict_gpu()
+                    gc.collect()
+                    torch.cuda.empty_cache()
 
         # If no refiner, return raw vision output
         return raw_vision_output
@@ -1751,10 +3865,21 @@ class UmiAIWildcardNode:
             else:
                 raise Exception("Auto-Update Failed! Check console for errors.")
 
+        result = self.render(kwargs)
+        return (result['model'], result['clip'], result['text'], result['negative'], result['width'], result['height'], result['lora_info'], result['llm_info'])
+
+    def render(self, kwargs, run_llm=True, run_danbooru=True, apply_loras=True, catalog_max_age=0.0, record=True):
+        """
+        Expands a template the way process() does and returns the outputs as a dict.
+        The preview endpoint turns off LLM/Vision tags, Danbooru lookups and LoRA patching;
+        those tags are then left unexpanded and LoRAs are only listed. It also passes
+        record=False, so a preview never moves the fingerprint IS_CHANGED compares against.
+        """
         import numpy as np 
 
         text = self.get_val(kwargs, "text", "", str)
         seed = self.get_val(kwargs, "seed", 0, int)
+        raw_text = text
         
         model = kwargs.get("model", None)
         clip = kwargs.get("clip", None)
@@ -1763,7 +3888,8 @@ class UmiAIWildcardNode:
         width = self.get_val(kwargs, "width", 1024, int)
         height = self.get_val(kwargs, "height", 1024, int)
         lora_tags_behavior = self.get_val(kwargs, "lora_tags_behavior", "Append to Prompt", str)
-        lora_cache_limit = self.get_val(kwargs, "lora_cache_limit", 5, int) 
+        lora_cache_limit = self.get_val(kwargs, "lora_cache_limit", 5, int)
+        lora_pin = bool(kwargs.get("lora_pin", False))
         input_negative = self.get_val(kwargs, "input_negative", "", str)
 
         # RENAMED INPUTS
@@ -1774,6 +3900,12 @@ class UmiAIWildcardNode:
         refiner_temperature = self.get_val(kwargs, "refiner_temperature", 0.7, float)
         max_tokens = self.get_val(kwargs, "max_tokens", 400, int)
         custom_system_prompt = self.get_val(kwargs, "custom_system_prompt", "", str)
+        llm_settings = LLMRunSettings(
+            profile=self.get_val(kwargs, "llm_profile", "Auto", str),
+            backend=self.get_val(kwargs, "llm_backend", LLM_BACKEND_LOCAL, str),
+            endpoint=self.get_val(kwargs, "llm_endpoint", DEFAULT_LLM_ENDPOINT, str),
+            latency_budget=self.get_val(kwargs, "llm_latency_budget", 0.0, float),
+        )
 
         danbooru_threshold = self.get_val(kwargs, "danbooru_threshold", 0.70, float)
         danbooru_max_tags = self.get_val(kwargs, "danbooru_max_tags", 15, int)
@@ -1801,73 +3933,105 @@ class UmiAIWildcardNode:
         options = {
             'verbose': False, 
             'seed': seed,
-            'ignore_paths': True
+            'ignore_paths': True,
+            'catalog_max_age': catalog_max_age,
         }
 
         all_wildcard_paths = get_all_wildcard_paths()
         tag_loader = TagLoader(all_wildcard_paths, options)
         
-        tag_selector = TagSelector(tag_loader, options)
-        neg_gen = NegativePromptGenerator()
-        
-        tag_replacer = TagReplacer(tag_selector)
-        dynamic_replacer = DynamicPromptReplacer(seed)
-        conditional_replacer = ConditionalReplacer()
-        variable_replacer = VariableReplacer()
-        danbooru_replacer = DanbooruReplacer(options)
         lora_handler = LoRAHandler()
+
+        # Everything up to the LoRA step depends only on these inputs and the library, unless
+        # an LLM, Vision or Danbooru stage rewrote the prompt; those runs are not cached
+        render_key = render_cache_key(text, seed, width, height, run_llm, run_danbooru, tag_loader.catalog_version)
+        cached = recall_render(render_key)
+        if cached is not None:
+            prompt, generated_negatives, dependencies = cached
+        else:
+            tag_selector = TagSelector(tag_loader, options)
+            neg_gen = NegativePromptGenerator()
         
-        # Initialize VisionReplacer
-        vision_replacer = VisionReplacer(self, vision_model, refiner_model, vision_temperature, refiner_temperature, max_tokens, image_input)
+            tag_replacer = TagReplacer(tag_selector)
+            dynamic_replacer = DynamicPromptReplacer(seed)
+            conditional_replacer = ConditionalReplacer()
+            variable_replacer = VariableReplacer()
+            danbooru_replacer = DanbooruReplacer(options)
         
-        # Initialize LLMReplacer
-        llm_replacer = LLMReplacer(self, refiner_model, refiner_temperature, max_tokens, custom_system_prompt)
+            # Initialize VisionReplacer
+            vision_replacer = VisionReplacer(self, vision_model, refiner_model, vision_temperature, refiner_temperature, max_tokens, image_input, llm_settings)
+        
+            # Initialize LLMReplacer
+            llm_replacer = LLMReplacer(self, refiner_model, refiner_temperature, max_tokens, custom_system_prompt, llm_settings)
 
-        globals_dict = tag_loader.load_globals()
-        variable_replacer.load_globals(globals_dict)
+            globals_dict = tag_loader.load_globals()
+            variable_replacer.load_globals(globals_dict)
 
-        prompt = text
-        previous_prompt = ""
-        iterations = 0
-        tag_selector.clear_seeded_values()
+            prompt = text
+            deterministic = True
+            previous_prompt = ""
+            iterations = 0
+            tag_selector.clear_seeded_values()
 
-        while previous_prompt != prompt and iterations < 50:
-            previous_prompt = prompt
+            while previous_prompt != prompt and iterations < 50:
+                previous_prompt = prompt
             
-            # Process Vision and LLM tags
-            prompt = vision_replacer.replace(prompt)
-            prompt = llm_replacer.replace(prompt)
-
-            prompt = variable_replacer.store_variables(prompt, tag_replacer, dynamic_replacer)
-            tag_selector.update_variables(variable_replacer.variables)
-            prompt = variable_replacer.replace_variables(prompt)
-            prompt = tag_replacer.replace(prompt)
-            prompt = dynamic_replacer.replace(prompt)
-            prompt = danbooru_replacer.replace(prompt, danbooru_threshold, danbooru_max_tags)
-            iterations += 1
+                # Process Vision and LLM tags
+                if run_llm:
+                    before = prompt
+                    prompt = vision_replacer.replace(prompt)
+                    prompt = llm_replacer.replace(prompt)
+                    deterministic = deterministic and prompt == before
+
+                prompt = variable_replacer.store_variables(prompt, tag_replacer, dynamic_replacer)
+                tag_selector.update_variables(variable_replacer.variables)
+                prompt = variable_replacer.replace_variables(prompt)
+                prompt = tag_replacer.replace(prompt)
+                prompt = dynamic_replacer.replace(prompt)
+                if run_danbooru:
+                    before = prompt
+                    prompt = danbooru_replacer.replace(prompt, danbooru_threshold, danbooru_max_tags)
+                    deterministic = deterministic and prompt == before
+                iterations += 1
             
-        prompt = conditional_replacer.replace(prompt, variable_replacer.variables)
+            prompt = conditional_replacer.replace(prompt, variable_replacer.variables)
         
-        additions = tag_selector.get_prefixes_and_suffixes()
-        if additions['prefixes']:
-            prompt = ", ".join(additions['prefixes']) + ", " + prompt
-        if additions['suffixes']:
-            prompt = prompt + ", " + ", ".join(additions['suffixes'])
-
-        if additions['neg_prefixes']:
-            neg_gen.add_list(additions['neg_prefixes'])
-        if additions['neg_suffixes']:
-            neg_gen.add_list(additions['neg_suffixes'])
-        if tag_selector.scoped_negatives:
-            neg_gen.add_list(tag_selector.scoped_negatives)
-
-        prompt = neg_gen.strip_negative_tags(prompt)
-        prompt = re.sub(r',\s*,', ',', prompt)
-        prompt = re.sub(r'\s+', ' ', prompt).strip().strip(',')
-
-        prompt, final_model, final_clip, lora_info = lora_handler.extract_and_load(prompt, model, clip, lora_tags_behavior, lora_cache_limit)
-
-        generated_negatives = neg_gen.get_negative_string()
+            additions = tag_selector.get_prefixes_and_suffixes()
+            if additions['prefixes']:
+                prompt = ", ".join(additions['prefixes']) + ", " + prompt
+            if additions['suffixes']:
+                prompt = prompt + ", " + ", ".join(additions['suffixes'])
+
+            if additions['neg_prefixes']:
+                neg_gen.add_list(additions['neg_prefixes'])
+            if additions['neg_suffixes']:
+                neg_gen.add_list(additions['neg_suffixes'])
+            if tag_selector.scoped_negatives:
+                neg_gen.add_list(tag_selector.scoped_negatives)
+
+            prompt = neg_gen.strip_negative_tags(prompt)
+            prompt = re.sub(r',\s*,', ',', prompt)
+            prompt = re.sub(r'\s+', ' ', prompt).strip().strip(',')
+
+            generated_negatives = neg_gen.get_negative_string()
+            dependencies = (
+                frozenset(tag_loader.dependencies), frozenset(tag_loader.resolved_keys),
+                frozenset(tag_loader.entry_titles), tag_loader.uses_index,
+            )
+            if deterministic:
+                remember_render(render_key, (prompt, generated_negatives, dependencies))
+        if record:
+            record_dependencies(raw_text, seed, dependencies)
+        WILDCARD_USAGE.flush()
+
+        if apply_loras:
+            prompt, final_model, final_clip, lora_info = lora_handler.extract_and_load(prompt, model, clip, lora_tags_behavior, lora_cache_limit, self.pin_owner, lora_pin)
+            lora_entries = []
+        else:
+            # Listed as if model/clip were connected, so the preview shows the tags they would add
+            prompt, lora_entries, info_blocks = lora_handler.parse_loras(prompt, lora_tags_behavior)
+            final_model, final_clip, lora_info = model, clip, lora_handler.format_info(info_blocks)
+
         final_negative = input_negative
         if generated_negatives:
             final_negative = f"{final_negative}, {generated_negatives}" if final_negative else generated_negatives
@@ -1878,54 +4042,334 @@ class UmiAIWildcardNode:
         final_width = settings['width'] if settings['width'] > 0 else width
         final_height = settings['height'] if settings['height'] > 0 else height
 
-        return (final_model, final_clip, prompt, final_negative, final_width, final_height, lora_info)
+        return {
+            'model': final_model,
+            'clip': final_clip,
+            'text': prompt,
+            'negative': final_negative,
+            'width': final_width,
+            'height': final_height,
+            'lora_info': lora_info,
+            'loras': [{'name': name, 'strength': strength, 'found': bool(path)} for name, path, strength, _ in lora_entries],
+            'llm_info': "\n".join(llm_settings.events),
+        }
 
 NODE_CLASS_MAPPINGS = {"UmiAIWildcardNode": UmiAIWildcardNode}
 NODE_DISPLAY_NAME_MAPPINGS = {"UmiAIWildcardNode": "UmiAI Wildcard Processor"}
 
+# ==============================================================================
+# BACKGROUND WARM-UP
+# ==============================================================================
+
+def warmup_preload_keys():
+    # Comma separated wildcard names to read into GLOBAL_CACHE at startup, e.g. "hair,outfits/casual",
+    # followed by the most used keys from the usage history
+    keys = [k.strip() for k in os.environ.get("UMIAI_WARMUP_PRELOAD", "").split(",") if k.strip()]
+    top = int(os.environ.get("UMIAI_WARMUP_PRELOAD_TOP", "100"))
+    if top > 0:
+        keys.extend(k for k in WILDCARD_USAGE.hot_keys(top) if k not in keys)
+    return keys
+
+def preload_wildcards():
+    keys = warmup_preload_keys()
+    if keys:
+        loader = TagLoader(get_all_wildcard_paths(), {'ignore_paths': True, 'verbose': False, 'catalog_max_age': CATALOG_API_MAX_AGE})
+        for key in keys:
+            # read_tags, not load_tags: preloading must not count as usage
+            if GLOBAL_CACHE.get(key) is None:
+                loader.read_tags(key)
+    return len(keys)
+
+class WarmUp:
+    """
+    Builds the shared indexes on a daemon thread right after import, so the first prompt
+    and the first editor load don't pay for them. Nothing waits on it: every index still
+    builds lazily on first use, and whichever side gets there first does the work once.
+    """
+    def __init__(self):
+        self.steps = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.state = {'status': 'pending', 'started': None, 'finished': None, 'steps': {}}
+
+    def add_step(self, name, fn, before=None):
+        """fn may return an item count for the metrics. `before` names an existing step."""
+        position = len(self.steps)
+        for i, (step_name, _) in enumerate(self.steps):
+            if step_name == before:
+                position = i
+                break
+        self.steps.insert(position, (name, fn))
+        self.state['steps'][name] = {'status': 'pending'}
+
+    def run(self):
+        start = time.monotonic()
+        self.state['status'] = 'running'
+        self.state['started'] = time.time()
+        for name, fn in self.steps:
+            step_start = time.monotonic()
+            self.state['steps'][name] = {'status': 'running'}
+            try:
+                result = fn()
+                self.state['steps'][name] = {'status': 'done', 'seconds': round(time.monotonic() - step_start, 3)}
+                if isinstance(result, int):
+                    self.state['steps'][name]['items'] = result
+                print(f"[UmiAI] Warm-up: {name} ready in {time.monotonic() - step_start:.2f}s")
+            except Exception as e:
+                self.state['steps'][name] = {'status': 'failed', 'error': str(e)}
+                print(f"[UmiAI] Warm-up: {name} failed, it will load on first use: {e}")
+        self.state['status'] = 'done'
+        self.state['finished'] = time.time()
+        print(f"[UmiAI] Warm-up finished in {time.monotonic() - start:.2f}s")
+
+    def start(self):
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self.run, name="UmiAI-WarmUp", daemon=True)
+            self.thread.start()
+
+    def stats(self):
+        return {
+            'status': self.state['status'],
+            'started': self.state['started'],
+            'finished': self.state['finished'],
+            'steps': {name: dict(self.state['steps'][name]) for name, _ in self.steps},
+        }
+
+def warm_catalog():
+    WILDCARD_CATALOG.refresh()
+    return len(WILDCARD_CATALOG.snapshot.files_index)
+
+def warm_lora_names():
+    LORA_NAME_INDEX.refresh()
+    return len(LORA_NAME_INDEX.names or [])
+
+WARMUP = WarmUp()
+WARMUP.add_step("wildcard catalog", warm_catalog)
+WARMUP.add_step("lora names", warm_lora_names)
+# With a shared catalog most processes only render, so the per-process structures derived
+# from it (autocomplete index, editor payload) are left to the first request that needs them
+if WILDCARD_CATALOG.shared is None:
+    WARMUP.add_step("autocomplete index", lambda: len(get_wildcard_search_index("wildcard")))
+WARMUP.add_step("preload wildcards", preload_wildcards)
+WARMUP.add_step("gguf registry", lambda: len(GGUF_REGISTRY.model_names()))
+WARMUP.add_step("lora metadata", lambda: LORA_METADATA_INDEX.build())
+
 # ==============================================================================
 # API ENDPOINTS
 # ==============================================================================
 
+# API requests may reuse a catalog scan this many seconds old; node runs always rescan
+CATALOG_API_MAX_AGE = 2.0
+
+def get_catalog_lists(max_age=CATALOG_API_MAX_AGE):
+    """(version, sorted wildcard names + tags, sorted LoRAs) from the shared catalog."""
+    WILDCARD_CATALOG.refresh(max_age=max_age)
+    snap = WILDCARD_CATALOG.snapshot
+    return snap.etag(), sorted(snap.files_index | snap.umi_tags), sorted(snap.loras)
+
 @server.PromptServer.instance.routes.get("/umiapp/wildcards")
 async def get_wildcards(request):
-    all_paths = get_all_wildcard_paths()
-    options = {'ignore_paths': True, 'verbose': False}
-    loader = TagLoader(all_paths, options)
-    loader.build_index()
-    
-    combined_list = sorted(list(loader.files_index | loader.umi_tags))
-    
-    loras = folder_paths.get_filename_list("loras")
-    loras = sorted(loras) if loras else []
+    def collect():
+        # tag_summary may load the LoRA index from disk, so it stays off the event loop too
+        return get_catalog_lists(), LORA_METADATA_INDEX.tag_summary(LORA_TAG_BLACKLIST)
+
+    loop = asyncio.get_running_loop()
+    (version, combined_list, loras), lora_tags = await loop.run_in_executor(None, collect)
 
     return web.json_response({
+        "version": version,
         "wildcards": combined_list,
         "loras": loras,
+        "lora_tags": lora_tags,
     })
 
+# Autocomplete indexes per kind, rebuilt when the catalog version changes
+WILDCARD_SEARCH_KINDS = ("wildcard", "file", "tag", "lora")
+WILDCARD_SEARCH_INDEXES = {}
+WILDCARD_SEARCH_LOCK = threading.Lock()
+
+def get_wildcard_search_index(kind):
+    WILDCARD_CATALOG.refresh(max_age=CATALOG_API_MAX_AGE)
+    snap = WILDCARD_CATALOG.snapshot
+    version = snap.version
+    files, tags, loras = snap.files_index, snap.umi_tags, snap.loras
+    sources = {'wildcard': (files, tags), 'file': (files,), 'tag': (tags,), 'lora': (loras,)}[kind]
+
+    with WILDCARD_SEARCH_LOCK:
+        cached = WILDCARD_SEARCH_INDEXES.get(kind)
+        if cached and cached[0] == version:
+            return cached[1]
+        items = set()
+        for source in sources:
+            items.update(source)
+        index = FuzzySearchIndex(items)
+        WILDCARD_SEARCH_INDEXES[kind] = (version, index)
+        return index
+
+@server.PromptServer.instance.routes.get("/umiapp/wildcards/search")
+async def search_wildcards(request):
+    """?q=&kind=wildcard|file|tag|lora&limit=&offset= -> one ranked page of matches."""
+    query = request.query.get("q", "")
+    kind = request.query.get("kind", "wildcard")
+    if kind not in WILDCARD_SEARCH_KINDS:
+        return web.json_response({"error": f"kind must be one of {', '.join(WILDCARD_SEARCH_KINDS)}"}, status=400)
+    try:
+        limit = max(1, min(int(request.query.get("limit", 50)), 500))
+        offset = max(0, int(request.query.get("offset", 0)))
+    except ValueError:
+        return web.json_response({"error": "limit and offset must be integers"}, status=400)
+
+    def run_search():
+        index = get_wildcard_search_index(kind)
+        items, has_more = index.search(query, limit, offset)
+        return items, has_more, len(index)
+
+    loop = asyncio.get_running_loop()
+    items, has_more, total = await loop.run_in_executor(None, run_search)
+    return web.json_response({"items": items, "has_more": has_more, "offset": offset, "indexed": total})
+
+PREVIEW_MAX_SEEDS = 64
+PREVIEW_OPTIONS = ("width", "height", "input_negative", "lora_tags_behavior", "danbooru_threshold", "danbooru_max_tags")
+
+@server.PromptServer.instance.routes.post("/umiapp/preview")
+async def preview_prompt(request):
+    """
+    Renders a template without queueing a graph.
+    Body: {"text": str, "seed": int | "seeds": [int] | "seed_range": [start, count],
+           "danbooru": bool, plus any of PREVIEW_OPTIONS}
+    LLM/Vision tags and LoRA patching are always skipped; Danbooru only runs when asked.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+
+    text = data.get("text")
+    if not isinstance(text, str):
+        return web.json_response({"error": "text is required"}, status=400)
+
+    try:
+        if "seeds" in data:
+            seeds = [int(x) for x in data["seeds"]]
+        elif "seed_range" in data:
+            start, count = (int(x) for x in data["seed_range"])
+            seeds = list(range(start, start + max(0, count)))
+        else:
+            seeds = [int(data.get("seed", 0))]
+    except (TypeError, ValueError):
+        return web.json_response({"error": "seed, seeds and seed_range must be integers"}, status=400)
+    if not seeds or len(seeds) > PREVIEW_MAX_SEEDS:
+        return web.json_response({"error": f"between 1 and {PREVIEW_MAX_SEEDS} seeds per request"}, status=400)
+
+    options = {key: data[key] for key in PREVIEW_OPTIONS if key in data}
+    run_danbooru = bool(data.get("danbooru", False))
+
+    def run_preview():
+        node = UmiAIWildcardNode()
+        results = []
+        for seed in seeds:
+            result = node.render(dict(options, text=text, seed=seed), run_llm=False, run_danbooru=run_danbooru, apply_loras=False, catalog_max_age=CATALOG_API_MAX_AGE, record=False)
+            results.append({
+                "seed": seed,
+                "text": result['text'],
+                "negative": result['negative'],
+                "width": result['width'],
+                "height": result['height'],
+                "loras": result['loras'],
+                "lora_info": result['lora_info'],
+            })
+        return results
+
+    start = time.monotonic()
+    loop = asyncio.get_running_loop()
+    try:
+        results = await loop.run_in_executor(None, run_preview)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+    return web.json_response({"results": results, "elapsed_ms": round((time.monotonic() - start) * 1000, 2)})
+
 @server.PromptServer.instance.routes.post("/umiapp/refresh")
 async def refresh_wildcards(request):
-    GLOBAL_CACHE.clear()
-    
-    GLOBAL_INDEX['built'] = False 
-    GLOBAL_INDEX['files'] = set()
-    GLOBAL_INDEX['entries'] = {}
-    GLOBAL_INDEX['tags'] = set()
-    
-    all_paths = get_all_wildcard_paths()
-    options = {'ignore_paths': True, 'verbose': False}
-    loader = TagLoader(all_paths, options)
-    loader.build_index() 
-    
-    combined_list = sorted(list(loader.files_index | loader.umi_tags))
-    
-    loras = folder_paths.get_filename_list("loras")
-    loras = sorted(loras) if loras else []
+    def full_rescan():
+        WILDCARD_CATALOG.reset()
+        return get_catalog_lists(max_age=0)
+
+    loop = asyncio.get_running_loop()
+    version, combined_list, loras = await loop.run_in_executor(None, full_rescan)
     
     return web.json_response({
         "status": "success", 
+        "version": version,
         "count": len(combined_list),
         "wildcards": combined_list,
         "loras": loras
-    })
\ No newline at end of file
+    })
+
+@server.PromptServer.instance.routes.get("/umiapp/danbooru/search")
+async def search_danbooru_names(request):
+    query = request.query.get("q", "").strip()
+    try:
+        limit = max(1, min(int(request.query.get("limit", 20)), 200))
+    except ValueError:
+        limit = 20
+    if not query:
+        return web.json_response({"names": []})
+
+    loop = asyncio.get_running_loop()
+    names = await loop.run_in_executor(None, DANBOORU_STORE.search_names, query, limit)
+    return web.json_response({"names": names})
+
+@server.PromptServer.instance.routes.get("/umiapp/stats")
+async def get_umi_stats(request):
+    return web.json_response({
+        "catalog": WILDCARD_CATALOG.stats(),
+        "lora_cache": LORA_MEMORY_CACHE.stats(),
+        "lora_lazy_load": LORA_LAZY_LOAD,
+        "patched_models": PATCHED_MODEL_CACHE.stats(),
+        "render_cache": dict(RENDER_CACHE_STATS, entries=len(RENDER_CACHE), limit=RENDER_CACHE_LIMIT),
+        "tag_cache": GLOBAL_CACHE.stats(),
+        "warmup": WARMUP.stats(),
+    })
+
+@server.PromptServer.instance.routes.get("/umiapp/usage")
+async def get_wildcard_usage(request):
+    """?limit=N -> most used wildcard keys with resolve/load counts and average load time."""
+    try:
+        limit = max(1, min(int(request.query.get("limit", 50)), USAGE_TOP_N))
+    except ValueError:
+        return web.json_response({"error": "limit must be an integer"}, status=400)
+    loop = asyncio.get_running_loop()
+    hot = await loop.run_in_executor(None, WILDCARD_USAGE.top, limit)
+    return web.json_response({"sample_rate": WILDCARD_USAGE.sample_rate, "hot": hot})
+
+@server.PromptServer.instance.routes.post("/umiapp/lora_cache")
+async def update_lora_cache(request):
+    """Body: {"pin": [names], "unpin": [names], "budget_mb": int, "lazy": bool}"""
+    global LORA_LAZY_LOAD
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+
+    missing = []
+    for name in data.get("pin", []):
+        path = LORA_NAME_INDEX.resolve(name)
+        if path:
+            LORA_MEMORY_CACHE.pin(path)
+        else:
+            missing.append(name)
+    for name in data.get("unpin", []):
+        path = LORA_NAME_INDEX.resolve(name)
+        if path:
+            LORA_MEMORY_CACHE.unpin(path)
+    if "budget_mb" in data:
+        try:
+            LORA_MEMORY_CACHE.set_budget(max(0, int(data["budget_mb"])) * 2**20)
+        except (TypeError, ValueError):
+            return web.json_response({"error": "budget_mb must be an integer"}, status=400)
+    if "lazy" in data:
+        LORA_LAZY_LOAD = bool(data["lazy"])
+
+    return web.json_response({"status": "success", "not_found": missing, "lora_cache": LORA_MEMORY_CACHE.stats()})
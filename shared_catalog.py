@@ -0,0 +1,370 @@
+import base64
+import datetime
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import ItemsView, Mapping, Set, ValuesView
+from contextlib import contextmanager
+from types import MappingProxyType
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# ==============================================================================
+# SHARED CATALOG FILE
+# ==============================================================================
+# The compiled wildcard catalog written by one process and memory-mapped read-only by
+# every ComfyUI process on the host (one per GPU), so the parsed library is held once
+# in the page cache instead of once per process. Layout, 8-byte aligned:
+#   MAGIC | u64 header length | JSON header | tables...
+# A table is a sorted run of (key, value) byte strings behind an array of 2n+1 offsets.
+# Lookups bisect the mapping in place and a value is only decoded when it is read.
+#
+# Values are plain JSON, never pickle: the file can sit in a host-wide location, and
+# decoding it must not be able to run code. Parsed YAML that JSON can't express
+# directly (sets, dates, binary, non-string keys) is wrapped in single-key marker objects.
+
+MAGIC = b"UMICAT02"
+U64 = struct.Struct("<Q")
+# Decoded values kept per table, so repeated reads of one YAML file don't re-parse it each time
+DECODE_CACHE_ITEMS = 32
+
+CODEC_NONE = "none"
+CODEC_STR = "str"
+CODEC_JSON = "json"
+
+class Raw(bytes):
+    """A value already encoded for a JSON table, copied into a new file as is."""
+
+def to_plain(value):
+    """yaml.safe_load output -> JSON-safe structure that from_plain turns back into it."""
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value):
+            return {k: to_plain(v) for k, v in value.items()}
+        return {"\0map": [[to_plain(k), to_plain(v)] for k, v in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {"\0set": [to_plain(v) for v in value]}
+    if isinstance(value, datetime.datetime):
+        return {"\0datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"\0date": value.isoformat()}
+    if isinstance(value, bytes):
+        return {"\0bytes": base64.b64encode(value).decode("ascii")}
+    return str(value)
+
+def hashable(value):
+    return tuple(hashable(v) for v in value) if isinstance(value, list) else value
+
+def from_plain_object(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key == "\0map":
+            return {hashable(k): v for k, v in value}
+        if key == "\0set":
+            return {hashable(v) for v in value}
+        if key == "\0datetime":
+            return datetime.datetime.fromisoformat(value)
+        if key == "\0date":
+            return datetime.date.fromisoformat(value)
+        if key == "\0bytes":
+            return base64.b64decode(value)
+    return obj
+
+def decode_json(data):
+    return json.loads(str(data, "utf-8", "surrogatepass"), object_hook=from_plain_object)
+
+def parsed(value):
+    return decode_json(value) if isinstance(value, Raw) else value
+
+def encode_key(key):
+    return key.encode("utf-8", "surrogateescape")
+
+def encode_value(codec, value):
+    if codec == CODEC_STR:
+        return value.encode("utf-8", "surrogateescape")
+    if codec == CODEC_JSON:
+        if isinstance(value, Raw):
+            return value
+        return json.dumps(to_plain(value), ensure_ascii=False, separators=(",", ":")).encode("utf-8", "surrogatepass")
+    return b""
+
+def pad8(size):
+    return -size % 8
+
+def pack_table(codec, items):
+    pairs = sorted((encode_key(k), encode_value(codec, v)) for k, v in items)
+    offsets = array("Q", [0])
+    chunks = []
+    pos = 0
+    for key, value in pairs:
+        chunks.append(key)
+        pos += len(key)
+        offsets.append(pos)
+        chunks.append(value)
+        pos += len(value)
+        offsets.append(pos)
+    return U64.pack(len(pairs)) + offsets.tobytes() + b"".join(chunks)
+
+def stamps_digest(stamps):
+    h = hashlib.sha1()
+    for path, (size, mtime_ns) in sorted(stamps.items()):
+        h.update(f"{path}\0{size}\0{mtime_ns}\n".encode("utf-8", "surrogateescape"))
+    return h.hexdigest()
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive lock on lock_path across processes on this host, held for the with block."""
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            while True:
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        yield
+    finally:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+class MappedItems(ItemsView):
+    def __iter__(self):
+        table = self._mapping
+        for i in range(len(table)):
+            yield table.key_at(i), table.value_at(i)
+
+class MappedValues(ValuesView):
+    def __iter__(self):
+        table = self._mapping
+        for i in range(len(table)):
+            yield table.value_at(i)
+
+class MappedTable(Mapping):
+    """Read-only str-keyed mapping over one table of a mapped catalog file."""
+    def __init__(self, buf, start, codec):
+        count = U64.unpack_from(buf, start)[0]
+        data_start = start + 8 + 8 * (2 * count + 1)
+        self.count = count
+        self.codec = codec
+        self.offsets = buf[start + 8:data_start].cast("Q")
+        self.data = buf[data_start:]
+        self.decoded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.count
+
+    def key_bytes(self, i):
+        return self.data[self.offsets[2 * i]:self.offsets[2 * i + 1]].tobytes()
+
+    def key_at(self, i):
+        return str(self.data[self.offsets[2 * i]:self.offsets[2 * i + 1]], "utf-8", "surrogateescape")
+
+    def raw_at(self, i):
+        return self.data[self.offsets[2 * i + 1]:self.offsets[2 * i + 2]]
+
+    def value_at(self, i):
+        if self.codec == CODEC_STR:
+            return str(self.raw_at(i), "utf-8", "surrogateescape")
+        if self.codec != CODEC_JSON:
+            return None
+        with self.lock:
+            if i in self.decoded:
+                self.decoded.move_to_end(i)
+                return self.decoded[i]
+        value = decode_json(self.raw_at(i))
+        with self.lock:
+            self.decoded[i] = value
+            while len(self.decoded) > DECODE_CACHE_ITEMS:
+                self.decoded.popitem(last=False)
+        return value
+
+    def find(self, key):
+        if not isinstance(key, str):
+            return -1
+        target = encode_key(key)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.key_bytes(lo) == target:
+            return lo
+        return -1
+
+    def __getitem__(self, key):
+        i = self.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.value_at(i)
+
+    def __contains__(self, key):
+        return self.find(key) >= 0
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.key_at(i)
+
+    def items(self):
+        return MappedItems(self)
+
+    def values(self):
+        return MappedValues(self)
+
+class RawTable(Mapping):
+    """A JSON table with its values left encoded, for copying into the next file."""
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, key):
+        i = self.table.find(key)
+        if i < 0:
+            raise KeyError(key)
+        return Raw(self.table.raw_at(i))
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+class MappedSet(Set):
+    """Read-only str set over a table stored without values."""
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return frozenset(it)
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+class MappedCatalog:
+    """One catalog file mapped read-only. The mapping stays open while anything references it."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self.identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(mm)
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError("not a catalog file")
+        header_len = U64.unpack_from(buf, 8)[0]
+        self.header = json.loads(bytes(buf[16:16 + header_len]))
+        self.tables = {
+            name: MappedTable(buf, start, codec)
+            for name, (start, codec) in self.header["tables"].items()
+        }
+        self.loras = tuple(self.header["loras"])
+        self.roots = tuple(self.header["roots"])
+        self.decoded = {}
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return self.tables[name]
+
+    def decoded_table(self, name):
+        """The whole table as a read-only dict, decoded once for this mapping. For small
+        indexes that are scanned in full (e.g. title -> tags), not for YAML bodies."""
+        with self.lock:
+            if name not in self.decoded:
+                self.decoded[name] = MappingProxyType(dict(self.tables[name].items()))
+            return self.decoded[name]
+
+    def members(self, name):
+        return MappedSet(self.tables[name])
+
+    def matches(self, roots, digest, loras):
+        return self.roots == tuple(roots) and self.header["stamps_digest"] == digest and self.loras == tuple(loras)
+
+class SharedCatalogStore:
+    """Publishes catalog files with an atomic replace and hands out the current mapping."""
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + ".lock"
+        self.mapped = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """The current file's MappedCatalog, remapped only when the file was replaced."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        with self.lock:
+            if self.mapped is None or self.mapped.identity != (st.st_ino, st.st_size, st.st_mtime_ns):
+                try:
+                    self.mapped = MappedCatalog(self.path)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"[UmiAI] Ignoring unreadable shared catalog {self.path}: {e}")
+                    return None
+            return self.mapped
+
+    def writer(self):
+        """Host-wide single-writer lock; other processes wait and then map the published file."""
+        return file_lock(self.lock_path)
+
+    def write(self, header, tables):
+        """tables: {name: (codec, iterable of (key, value))}. Call with writer() held."""
+        blobs = [(name, codec, pack_table(codec, items)) for name, (codec, items) in tables.items()]
+
+        # Table offsets go in the header, whose length shifts them; settle on a padded size
+        header = dict(header, tables={})
+        size = 0
+        while True:
+            pos = 16 + size + pad8(size)
+            header["tables"] = {}
+            for name, codec, blob in blobs:
+                header["tables"][name] = [pos, codec]
+                pos += len(blob) + pad8(len(blob))
+            encoded = json.dumps(header).encode("utf-8")
+            if len(encoded) <= size:
+                break
+            size = len(encoded) + 64
+
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(U64.pack(len(encoded)))
+            f.write(encoded + b" " * (size - len(encoded) + pad8(size)))
+            for _, _, blob in blobs:
+                f.write(blob)
+                f.write(b"\0" * pad8(len(blob)))
+        os.replace(tmp, self.path)